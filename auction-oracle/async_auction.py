@@ -0,0 +1,126 @@
+"""
+An asyncio front end for Auction.
+
+Bids from many coroutines go into a bounded queue, so producers wait
+(backpressure) when the auction falls behind.  One worker task takes
+whatever bids are waiting, up to a batch size, and applies them in
+arrival order with Auction's own rules and exceptions.
+
+Example:
+    async def main():
+        auction = AsyncAuction(Auction("Python Cookbook"))
+        await auction.start()
+        updates = auction.subscribe()
+        await auction.bid("Jim", 100)
+        print(await updates.get())       # (100, 'Jim')
+        await auction.close()
+"""
+import asyncio
+from auction import Auction
+
+
+class AsyncAuction:
+    """Asynchronous facade for one Auction.
+
+       auction: the Auction that bids are applied to
+       max_queue: most bids that can be waiting before bid() blocks
+       max_batch: most bids applied by the worker in one batch
+    """
+
+    def __init__(self, auction: Auction, max_queue=1000, max_batch=100):
+        self.auction = auction
+        self.queue = asyncio.Queue(max_queue)
+        self.max_batch = max_batch
+        self.subscribers = set()
+        self.worker = None
+
+    async def start(self):
+        """Start the worker, if not already running, and enable bidding."""
+        if self.worker is None:
+            self.worker = asyncio.create_task(self.process_bids())
+        await self.submit(self.auction.start)
+
+    async def stop(self):
+        """Disable bidding, after all bids already submitted are handled."""
+        await self.submit(self.auction.stop)
+
+    async def bid(self, bidder_name, amount):
+        """Submit a bid and wait until it is accepted or rejected.
+
+           Raises the same exceptions as Auction.bid().
+        """
+        await self.submit(self.auction.bid, bidder_name, amount)
+
+    def best_bid(self):
+        """Return the highest bid so far."""
+        return self.auction.best_bid()
+
+    def winner(self):
+        """Return name of person who placed the highest bid."""
+        return self.auction.winner()
+
+    def subscribe(self, maxsize=100):
+        """Return an asyncio.Queue that receives (best_bid, winner)
+           each time the leader changes.  If the subscriber falls
+           behind by maxsize updates, the oldest update is dropped.
+        """
+        updates = asyncio.Queue(maxsize)
+        self.subscribers.add(updates)
+        return updates
+
+    def unsubscribe(self, updates):
+        """Stop sending leader changes to a queue from subscribe()."""
+        self.subscribers.discard(updates)
+
+    async def close(self):
+        """Wait for submitted bids to be handled, then stop the worker."""
+        if self.worker is None:
+            return
+        await self.queue.join()
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.worker = None
+
+    async def submit(self, method, *args):
+        """Queue a call to an Auction method and wait for its result.
+           If the worker is not running the method is called directly.
+        """
+        if self.worker is None:
+            return method(*args)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((method, args, future))
+        return await future
+
+    async def process_bids(self):
+        """Worker task: apply queued calls in batches, in arrival order."""
+        queue = self.queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            leader = (self.auction.best_bid(), self.auction.winner())
+            for (method, args, future) in batch:
+                try:
+                    result = method(*args)
+                except Exception as ex:
+                    if not future.done():
+                        future.set_exception(ex)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                queue.task_done()
+            if self.subscribers:
+                self.publish(leader)
+
+    def publish(self, old_leader):
+        """Send the current leader to subscribers if it has changed."""
+        leader = (self.auction.best_bid(), self.auction.winner())
+        if leader == old_leader:
+            return
+        for updates in self.subscribers:
+            if updates.full():
+                updates.get_nowait()
+            updates.put_nowait(leader)
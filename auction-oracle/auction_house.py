@@ -0,0 +1,206 @@
+"""
+An auction house: many auctions, one per item, spread over worker
+processes so that bidding on different items is not limited by one
+interpreter's GIL.
+
+Each item is assigned to a shard (worker process) by a hash of the
+item name, and all calls for that item are routed to its shard.
+
+Example:
+    with AuctionHouse(shards=4) as house:
+        house.add("Python Cookbook")
+        house.start("Python Cookbook")
+        house.bid("Python Cookbook", "Jim", 100)
+        house.winner("Python Cookbook")           # 'Jim'
+        house.is_active("Python Cookbook")        # True
+        house.top(10)                             # [(100, 'Python Cookbook')]
+"""
+import heapq
+import multiprocessing
+import zlib
+from auction import Auction
+
+# Auction methods that can be called on one item
+ITEM_METHODS = {"bid", "best_bid", "winner", "start", "stop", "is_active"}
+
+
+class AuctionHouse:
+    """Auctions for many items, sharded across worker processes.
+
+       shards: number of worker processes
+       testcase: TESTCASE behavior of the auctions, default is
+                 Auction.get_testcase()
+    """
+
+    def __init__(self, shards=4, testcase=None):
+        if shards < 1:
+            raise ValueError("number of shards must be positive")
+        if testcase is None:
+            testcase = Auction.get_testcase()
+        self.connections = []
+        self.processes = []
+        for n in range(shards):
+            parent_end, child_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=serve_shard,
+                                              args=(child_end, testcase),
+                                              daemon=True)
+            process.start()
+            child_end.close()
+            self.connections.append(parent_end)
+            self.processes.append(process)
+
+    def shard_of(self, item):
+        """Return the index of the shard that holds an item."""
+        return zlib.crc32(item.encode()) % len(self.connections)
+
+    def call(self, item, method, *args):
+        """Call a method for an item in its shard and return the result,
+           or raise the exception raised by the shard.
+        """
+        conn = self.connections[self.shard_of(item)]
+        conn.send((method, item, args))
+        return receive(conn)
+
+    def add(self, item, min_increment=1):
+        """Create a new auction for an item."""
+        self.call(item, "add", min_increment)
+
+    def bid(self, item, bidder_name, amount):
+        """Submit a bid for an item. Raises the same exceptions as Auction.bid()."""
+        self.call(item, "bid", bidder_name, amount)
+
+    def best_bid(self, item):
+        """Return the highest bid so far for an item."""
+        return self.call(item, "best_bid")
+
+    def winner(self, item):
+        """Return name of person who placed the highest bid for an item."""
+        return self.call(item, "winner")
+
+    def start(self, item):
+        """Enable bidding for an item."""
+        self.call(item, "start")
+
+    def stop(self, item):
+        """Disable bidding for an item."""
+        self.call(item, "stop")
+
+    def is_active(self, item):
+        """Return True if bidding is enabled for an item.
+
+           >>> with AuctionHouse(shards=2) as house:
+           ...     house.add("Clock")
+           ...     before = house.is_active("Clock")
+           ...     house.start("Clock")
+           ...     (before, house.is_active("Clock"))
+           (False, True)
+        """
+        return self.call(item, "is_active")
+
+    def bid_many(self, bids):
+        """Submit many bids, given as (item, bidder_name, amount) tuples.
+
+           Bids for the same item are applied in order; bids are sent to
+           all shards first, so the shards process them in parallel.
+           Returns a list of (row, exception) for rejected bids, where
+           row is the 0-based position of the bid in bids.
+        """
+        batches = [[] for conn in self.connections]
+        for row, (item, bidder_name, amount) in enumerate(bids):
+            batches[self.shard_of(item)].append((row, item, bidder_name, amount))
+        for conn, batch in zip(self.connections, batches):
+            conn.send(("bid_many", None, (batch,)))
+        rejected = []
+        for conn in self.connections:
+            rejected.extend(receive(conn))
+        rejected.sort(key=lambda rejection: rejection[0])
+        return rejected
+
+    def top(self, n):
+        """Return the n items with the highest best bid,
+           as a list of (best_bid, item) in descending order.
+        """
+        for conn in self.connections:
+            conn.send(("top", None, (n,)))
+        best = []
+        for conn in self.connections:
+            best.extend(receive(conn))
+        return heapq.nlargest(n, best)
+
+    def count(self):
+        """Return the number of auctions in the house."""
+        for conn in self.connections:
+            conn.send(("count", None, ()))
+        return sum(receive(conn) for conn in self.connections)
+
+    def close(self):
+        """Stop the worker processes."""
+        for conn in self.connections:
+            conn.send(("close", None, ()))
+            conn.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def receive(conn):
+    """Receive the reply to a request, raising it if it is an exception."""
+    ok, result = conn.recv()
+    if not ok:
+        raise result
+    return result
+
+
+def serve_shard(conn, testcase):
+    """Worker process: handle requests for the auctions in one shard."""
+    Auction.set_testcase(testcase)
+    auctions = {}
+    while True:
+        try:
+            method, item, args = conn.recv()
+        except EOFError:
+            break
+        if method == "close":
+            break
+        try:
+            reply = (True, handle(auctions, method, item, args))
+        except Exception as ex:
+            reply = (False, ex)
+        conn.send(reply)
+    conn.close()
+
+
+def handle(auctions, method, item, args):
+    """Perform one request on the auctions of a shard."""
+    if method == "add":
+        if item in auctions:
+            raise ValueError(f"Auction for {item} already exists")
+        auctions[item] = Auction(item, *args)
+        return None
+    if method in ITEM_METHODS:
+        if item not in auctions:
+            raise KeyError(f"No auction for {item}")
+        return getattr(auctions[item], method)(*args)
+    if method == "bid_many":
+        rejected = []
+        for (row, item, bidder_name, amount) in args[0]:
+            try:
+                auctions[item].bid(bidder_name, amount)
+            except KeyError:
+                rejected.append((row, KeyError(f"No auction for {item}")))
+            except Exception as ex:
+                rejected.append((row, ex))
+        return rejected
+    if method == "top":
+        return heapq.nlargest(args[0], ((auction.best_bid(), name)
+                                        for (name, auction) in auctions.items()))
+    if method == "count":
+        return len(auctions)
+    raise ValueError(f"Unknown request {method}")
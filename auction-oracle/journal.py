@@ -0,0 +1,264 @@
+"""
+Append-only journal of an auction's accepted bids and start/stop
+events, so that an auction can be rebuilt after a process restart.
+
+Each record is 13 bytes: kind (1 byte), bidder id (4 bytes) and
+amount (8 bytes, int64 or double).  A bidder's name is written once,
+in a NAME record followed by the UTF-8 name, and later bids refer to
+it by id.  Recovery loads the latest snapshot, if any, and replays
+only the journal records written after it.
+
+Example:
+    auction = Auction("Python Cookbook", journal=BidJournal("cookbook.log"))
+    auction.start()
+    auction.bid("Jim", 100)
+    ...
+    # after a restart
+    auction = recover("cookbook.log")
+"""
+import os
+import pickle
+import struct
+from auction import Auction
+
+# kinds of record
+HEADER = 0
+START = 1
+STOP = 2
+NAME = 3
+BID_INT = 4
+BID_FLOAT = 5
+# bid amount that doesn't fit in 8 bytes, stored as a pickle
+BID_OBJECT = 6
+
+# HEADER, NAME and BID_OBJECT records are followed by data
+# with length given in the amount field
+RECORD = struct.Struct('<BIq')
+FLOAT_RECORD = struct.Struct('<BId')
+
+FSYNC_POLICIES = ("always", "batch", "never")
+
+
+class BidJournal:
+    """Write-ahead journal for one Auction.
+
+       path: the journal file.  Snapshots are written to path + ".snap".
+       fsync: "always" writes and fsyncs every record;
+              "batch" (group commit) writes and fsyncs every batch_size
+              records, and when flush() or close() is called;
+              "never" leaves writing to disk to the operating system.
+       batch_size: number of records in a group commit
+       snapshot_every: write a snapshot after this many records
+              (0 for no automatic snapshots)
+    """
+
+    def __init__(self, path, fsync="batch", batch_size=1000, snapshot_every=100000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy must be one of {FSYNC_POLICIES}")
+        self.path = path
+        self.fsync = fsync
+        self.batch_size = batch_size if fsync != "always" else 1
+        self.snapshot_every = snapshot_every
+        self.file = open(path, 'ab')
+        self.buffer = bytearray()
+        self.pending = 0
+        self.since_snapshot = 0
+        # id of each bidder name written to the journal
+        self.ids = {}
+        self.auction = None
+
+    def attach(self, auction, resume=False):
+        """Journal the events of an auction. A new journal starts with
+           a header that has the auction name and bid increment.
+           A journal that already has records can only be continued by
+           recover(), which resumes it with the ids of its bidders.
+        """
+        if self.file.tell() != 0 and not resume:
+            raise ValueError(f"{self.path} already has records; use recover() to continue it")
+        self.auction = auction
+        if self.file.tell() == 0:
+            self.append_data(HEADER, 0, pickle.dumps((auction.name, auction.increment)))
+            self.flush()
+
+    def start(self):
+        """Record that bidding was enabled."""
+        self.append(RECORD.pack(START, 0, 0))
+
+    def stop(self):
+        """Record that bidding was disabled."""
+        self.append(RECORD.pack(STOP, 0, 0))
+
+    def bid(self, bidder_name, amount):
+        """Record an accepted bid."""
+        bidder = self.ids.get(bidder_name)
+        if bidder is None:
+            bidder = self.ids[bidder_name] = len(self.ids)
+            self.append_data(NAME, bidder, bidder_name.encode())
+        if type(amount) is int and -2**63 <= amount < 2**63:
+            self.append(RECORD.pack(BID_INT, bidder, amount))
+        elif type(amount) is float:
+            self.append(FLOAT_RECORD.pack(BID_FLOAT, bidder, amount))
+        else:
+            self.append_data(BID_OBJECT, bidder, pickle.dumps(amount))
+
+    def append_data(self, kind, bidder, data):
+        """Append a record that is followed by variable length data."""
+        self.append(RECORD.pack(kind, bidder, len(data)) + data)
+
+    def append(self, record):
+        """Append a record, writing the buffer when a batch is full."""
+        self.buffer += record
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+        self.since_snapshot += 1
+        if self.snapshot_every and self.since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def flush(self):
+        """Write buffered records, and fsync unless policy is "never"."""
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+        self.pending = 0
+        self.file.flush()
+        if self.fsync != "never":
+            os.fsync(self.file.fileno())
+
+    def snapshot(self):
+        """Save the auction's state and the journal position it includes."""
+        self.flush()
+        auction = self.auction
+        state = {
+            "offset": self.file.tell(),
+            "name": auction.name,
+            "increment": auction.increment,
+            "bids": auction.bids,
+            "last_bidder": auction.last_bidder,
+            "active": auction.active,
+            "names": list(self.ids),
+        }
+        temp = self.path + ".snap.tmp"
+        with open(temp, 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.path + ".snap")
+        self.since_snapshot = 0
+
+    def close(self):
+        """Write all buffered records and close the journal file."""
+        self.flush()
+        self.file.close()
+
+
+def read_snapshot(path):
+    """Return the snapshot state for a journal, or None if no snapshot."""
+    try:
+        with open(path + ".snap", 'rb') as file:
+            return pickle.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def recover(path, profile=None, history=False, **journal_options):
+    """Rebuild an Auction from its journal and latest snapshot.
+
+       The recovered auction continues writing to the same journal,
+       using BidJournal(path, **journal_options).
+       Only accepted bids are journaled, so last_bidder is the last
+       accepted bidder, not the last bidder who was rejected.
+       If history is True, the history has the bids after the snapshot.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "bids.log")
+    >>> auction = Auction("Cookbook", journal=BidJournal(path))
+    >>> auction.start()
+    >>> auction.bid("Ann", 10)
+    >>> auction.bid("Bob", 20)
+    >>> auction.journal.close()
+    >>> journal = BidJournal(path)
+    >>> Auction("Cookbook", journal=journal)  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+       ...
+    ValueError: ... already has records; use recover() to continue it
+    >>> journal.close()
+    >>> auction = recover(path)
+    >>> auction.bid("Cid", 30)
+    >>> auction.bid("Ann", 40)
+    >>> auction.journal.close()
+    >>> auction = recover(path)
+    >>> auction.best_bid(), auction.winner(), auction.journal.ids
+    (40, 'Ann', {'Ann': 0, 'Bob': 1, 'Cid': 2})
+    >>> auction.journal.close()
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    unpack = RECORD.unpack_from
+    size = RECORD.size
+    state = read_snapshot(path)
+    if state is None:
+        kind, bidder, length = unpack(data, 0) if len(data) >= size else (None, 0, 0)
+        if kind != HEADER:
+            raise ValueError(f"{path} is not a bid journal")
+        offset = size + length
+        auction_name, increment = pickle.loads(data[size:offset])
+        state = {"name": auction_name, "increment": increment,
+                 "bids": {"no bids": 0}, "last_bidder": "no bids",
+                 "active": None, "names": []}
+    else:
+        offset = state["offset"]
+    auction = Auction(state["name"], state["increment"], profile=profile,
+                      history=history)
+    # bidder names by id
+    names = dict(enumerate(state["names"]))
+    bids = state["bids"]
+    last_bidder = state["last_bidder"]
+    active = state["active"]
+    unpack_float = FLOAT_RECORD.unpack_from
+    record = auction.history.append if history else None
+    end = len(data)
+    while offset < end:
+        if end - offset < size:
+            # a record only partly written when the process stopped
+            break
+        kind, bidder, amount = unpack(data, offset)
+        offset += size
+        if kind == BID_INT:
+            pass
+        elif kind == BID_FLOAT:
+            amount = unpack_float(data, offset - size)[2]
+        elif kind == START:
+            active = True
+            continue
+        elif kind == STOP:
+            active = False
+            continue
+        else:
+            if offset + amount > end:
+                offset -= size
+                break
+            payload = data[offset:offset+amount]
+            offset += amount
+            if kind == NAME:
+                names[bidder] = payload.decode()
+                continue
+            amount = pickle.loads(payload)
+        last_bidder = names[bidder]
+        bids[last_bidder] = amount
+        if record is not None:
+            record(last_bidder, amount)
+    auction.bids = bids
+    auction.leader = auction.find_leader()
+    auction.last_bidder = last_bidder
+    if active is not None:
+        auction.active = active
+    if offset < end:
+        # drop a partly written record at the end
+        with open(path, 'r+b') as file:
+            file.truncate(offset)
+    journal = BidJournal(path, **journal_options)
+    journal.ids = {name: bidder for (bidder, name) in sorted(names.items())}
+    auction.journal = journal
+    journal.attach(auction, resume=True)
+    return auction
@@ -0,0 +1,357 @@
+"""
+Append-only log of the transactions of many bank accounts, and
+snapshots of the accounts, so that accounts can be rebuilt after a
+process restart.
+
+Each record is 13 bytes: kind (1 byte), account id (4 bytes) and
+amount (8 bytes, double or int64), like the records of journal.py in
+auction-oracle.  A new account is written once, in an OPEN record
+followed by the pickled account.  A deposited check is a CHECK record
+followed by the pickled check and its clear_after time.
+
+A snapshot file has each account pickled separately and an index of
+where each one starts.  Loading a snapshot memory-maps the file and
+reads nothing else; an account is unpickled the first time it is used.
+Recovery loads the latest snapshot and replays only the records
+written after it.
+
+Accounts can also be pickled, to move them to another process.  The
+copy is not in any log.
+
+Example:
+    log = AccountLog("accounts.log")
+    acct = BankAccount("Taksin Shinawat", 1000, log=log)
+    acct.deposit(Money(10000))
+    ...
+    log.snapshot()
+    # after a restart
+    log = recover("accounts.log")
+    acct = log.account(0)
+
+snapshot() must not run while other threads are doing transactions
+with the log's accounts.
+"""
+import collections
+import mmap
+import os
+import pickle
+import struct
+import threading
+from account_support import load_money, lazy_money
+
+__getattr__ = lazy_money(globals())
+
+# kinds of record
+OPEN = 1
+DEPOSIT = 2
+CHECK = 3
+CLEAR = 4
+WITHDRAW = 5
+CLEAR_DUE = 6
+# the balance from before a withdraw, restored because a transfer
+# could not deposit it
+REFUND = 7
+# flags added to the kind: the amount is an int64, or the record is
+# followed by a pickle with length given in the amount field
+INT = 0x40
+OBJECT = 0x80
+KIND = 0x3f
+
+RECORD = struct.Struct('<BIq')
+FLOAT_RECORD = struct.Struct('<BId')
+
+FSYNC_POLICIES = ("always", "batch", "never")
+
+# snapshot header: magic, log offset of the snapshot, number of accounts.
+# The header is followed by count+1 file offsets (native uint64), where
+# account n is the pickle from offset n to offset n+1.
+SNAPSHOT_HEADER = struct.Struct('<8sQQ')
+SNAPSHOT_MAGIC = b'ACCTSNAP'
+
+# what a logged clear passes to clear_check when the log is replayed
+ClearedCheck = collections.namedtuple('ClearedCheck', 'check_number')
+
+
+class AccountLog:
+    """Write-ahead log for many BankAccounts.
+
+       path: the log file.  Snapshots are written to path + ".snap".
+       fsync: "always" writes and fsyncs every record;
+              "batch" (group commit) writes and fsyncs every batch_size
+              records, and when flush() or close() is called;
+              "never" leaves writing to disk to the operating system.
+       batch_size: number of records in a group commit
+    """
+
+    def __init__(self, path, fsync="batch", batch_size=1000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy must be one of {FSYNC_POLICIES}")
+        self.path = path
+        self.fsync = fsync
+        self.batch_size = batch_size if fsync != "always" else 1
+        self.file = open(path, 'ab')
+        self.buffer = bytearray()
+        self.pending = 0
+        # accounts may be used by many threads
+        self.lock = threading.RLock()
+        # accounts by id.  After recovery, accounts in the snapshot
+        # are not here until they are used.
+        self.accounts = {}
+        self.base = None
+        self.count = 0
+        # True if the file already has records, which only recover()
+        # can continue, since it knows how many accounts they open
+        self.reopened = self.file.tell() != 0
+
+    def attach(self, account):
+        """Add a new account to the log. Returns the account's id.
+           A log that already has records can only be continued by
+           recover(), so that new accounts do not reuse the ids of
+           accounts in it.
+
+           >>> import tempfile
+           >>> from bank_correct import BankAccount
+           >>> path = os.path.join(tempfile.mkdtemp(), "accounts.log")
+           >>> log = AccountLog(path)
+           >>> acct = BankAccount("Ann", log=log)
+           >>> log.close()
+           >>> BankAccount("Bob", log=AccountLog(path))  # doctest: +ELLIPSIS
+           Traceback (most recent call last):
+           ...
+           ValueError: ...accounts.log already has records; use recover() to continue it
+           >>> log = recover(path)
+           >>> BankAccount("Bob", log=log).account_name, log.account(0).account_name, len(log)
+           ('Bob', 'Ann', 2)
+           >>> log.close()
+        """
+        with self.lock:
+            if self.reopened:
+                raise ValueError(f"{self.path} already has records; use recover() to continue it")
+            account_id = self.count
+            self.count += 1
+            self.accounts[account_id] = account
+            self.append_data(OPEN, account_id, pickle.dumps(account))
+        return account_id
+
+    def account(self, account_id):
+        """The account with an id, loading it from the snapshot if needed."""
+        with self.lock:
+            account = self.accounts.get(account_id)
+            if account is None:
+                if not 0 <= account_id < self.count:
+                    raise KeyError(account_id)
+                account = self.accounts[account_id] = self.base.load(account_id)
+                account.set_log(self, account_id)
+            return account
+
+    def __len__(self):
+        return self.count
+
+    def deposit(self, account_id, value):
+        """Record a deposit of cash."""
+        self.append_amount(DEPOSIT, account_id, value)
+
+    def deposit_check(self, account_id, check, clear_after):
+        """Record a deposit of a check."""
+        self.append_data(CHECK, account_id, pickle.dumps((check, clear_after)))
+
+    def clear(self, account_id, check_number):
+        """Record that a check was cleared."""
+        self.append_amount(CLEAR, account_id, check_number)
+
+    def withdraw(self, account_id, amount):
+        """Record a withdraw."""
+        self.append_amount(WITHDRAW, account_id, amount)
+
+    def clear_due(self, account_id, now):
+        """Record that checks due at time now were cleared."""
+        self.append_amount(CLEAR_DUE, account_id, now)
+
+    def refund(self, account_id, balance):
+        """Record that a failed transfer restored the balance of an
+           account (in the account's units) from before its withdraw.
+        """
+        self.append_amount(REFUND, account_id, balance)
+
+    def append_amount(self, kind, account_id, amount):
+        """Append a record of an amount, as a double, int64 or pickle."""
+        if type(amount) is float:
+            self.append(FLOAT_RECORD.pack(kind, account_id, amount))
+        elif type(amount) is int and -2**63 <= amount < 2**63:
+            self.append(RECORD.pack(kind | INT, account_id, amount))
+        else:
+            self.append_data(kind, account_id, pickle.dumps(amount))
+
+    def append_data(self, kind, account_id, data):
+        """Append a record that is followed by a pickle."""
+        self.append(RECORD.pack(kind | OBJECT, account_id, len(data)) + data)
+
+    def append(self, record):
+        """Append a record, writing the buffer when a batch is full."""
+        with self.lock:
+            self.buffer += record
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """Write buffered records, and fsync unless policy is "never"."""
+        with self.lock:
+            if self.buffer:
+                self.file.write(self.buffer)
+                self.buffer.clear()
+            self.pending = 0
+            self.file.flush()
+            if self.fsync != "never":
+                os.fsync(self.file.fileno())
+
+    def snapshot(self):
+        """Save all the accounts and the log position they include.
+           Accounts that were not used since the last snapshot are copied
+           from it without unpickling them.
+        """
+        with self.lock:
+            self.flush()
+            temp = self.path + ".snap.tmp"
+            offsets = [SNAPSHOT_HEADER.size + 8 * (self.count + 1)]
+            with open(temp, 'wb') as file:
+                file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.file.tell(), self.count))
+                file.seek(offsets[0])
+                for account_id in range(self.count):
+                    account = self.accounts.get(account_id)
+                    if account is not None:
+                        file.write(pickle.dumps(account, protocol=pickle.HIGHEST_PROTOCOL))
+                    else:
+                        with self.base.data(account_id) as data:
+                            file.write(data)
+                    offsets.append(file.tell())
+                file.seek(SNAPSHOT_HEADER.size)
+                file.write(struct.pack(f'={len(offsets)}Q', *offsets))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp, self.path + ".snap")
+            # accounts not used yet are read from the new snapshot
+            old = self.base
+            self.base = AccountSnapshot(self.path + ".snap")
+            if old is not None:
+                old.close()
+
+    def close(self):
+        """Write all buffered records and close the log file."""
+        self.flush()
+        self.file.close()
+        if self.base is not None:
+            self.base.close()
+
+
+class AccountSnapshot:
+    """The accounts in a snapshot file, which is memory-mapped.
+       Accounts are unpickled only when load() is called.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.offset, count = SNAPSHOT_HEADER.unpack_from(self.map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not an account snapshot")
+        start = SNAPSHOT_HEADER.size
+        self.index = memoryview(self.map)[start:start + 8 * (count + 1)].cast('Q')
+
+    def __len__(self):
+        return len(self.index) - 1
+
+    def data(self, account_id):
+        """The pickled account, as a memoryview of the file."""
+        return memoryview(self.map)[self.index[account_id]:self.index[account_id + 1]]
+
+    def load(self, account_id):
+        """Unpickle an account."""
+        with self.data(account_id) as data:
+            return pickle.loads(data)
+
+    def close(self):
+        self.index.release()
+        self.map.close()
+
+
+def read_snapshot(path):
+    """Return the AccountSnapshot for a log, or None if no snapshot."""
+    try:
+        return AccountSnapshot(path + ".snap")
+    except FileNotFoundError:
+        return None
+
+
+def recover(path, **log_options):
+    """Rebuild the accounts in a log from the latest snapshot and the log.
+
+       Returns an AccountLog(path, **log_options) that the recovered
+       accounts continue writing to.  Use log.account(id) to get them;
+       accounts in the snapshot that have no records after it are not
+       loaded until then.
+    """
+    load_money(globals())
+    with open(path, 'rb') as file:
+        data = file.read()
+    snapshot = read_snapshot(path)
+    offset = snapshot.offset if snapshot else 0
+    count = len(snapshot) if snapshot else 0
+    accounts = {}
+
+    def account(account_id):
+        if account_id not in accounts:
+            accounts[account_id] = snapshot.load(account_id)
+        return accounts[account_id]
+
+    unpack = RECORD.unpack_from
+    unpack_float = FLOAT_RECORD.unpack_from
+    size = RECORD.size
+    end = len(data)
+    while offset < end:
+        if end - offset < size:
+            # a record only partly written when the process stopped
+            break
+        flags, account_id, amount = unpack(data, offset)
+        kind = flags & KIND
+        if flags & OBJECT:
+            if offset + size + amount > end:
+                break
+            payload = data[offset + size:offset + size + amount]
+            offset += size + amount
+            amount = pickle.loads(payload)
+        else:
+            if not flags & INT:
+                amount = unpack_float(data, offset)[2]
+            offset += size
+        if kind == OPEN:
+            accounts[account_id] = amount
+            count = max(count, account_id + 1)
+        elif kind == DEPOSIT:
+            account(account_id).deposit(Money(amount))
+        elif kind == CHECK:
+            check, clear_after = amount
+            account(account_id).deposit(check, clear_after=clear_after)
+        elif kind == CLEAR:
+            account(account_id).clear_check(ClearedCheck(amount))
+        elif kind == WITHDRAW:
+            account(account_id).withdraw(amount)
+        elif kind == CLEAR_DUE:
+            account(account_id).clear_due(amount)
+        elif kind == REFUND:
+            account(account_id)._refund(amount)
+        else:
+            raise ValueError(f"{path}: unknown record kind {kind}")
+    if offset < end:
+        # drop a partly written record at the end
+        with open(path, 'r+b') as file:
+            file.truncate(offset)
+    log = AccountLog(path, **log_options)
+    log.base = snapshot
+    log.count = count
+    log.reopened = False
+    log.accounts = accounts
+    for (account_id, acct) in accounts.items():
+        acct.set_log(log, account_id)
+    return log
@@ -0,0 +1,270 @@
+"""
+Many bank accounts kept in NumPy arrays, for bulk operations.
+
+An AccountStore has the balance, minimum balance and total of pending
+check holds of each account in arrays indexed by account id.  Bulk
+deposit, clear and withdraw apply the same rules as BankAccount to
+every account in the operation at once: each rule is a mask, and each
+operation returns a boolean array of which entries were accepted
+(instead of raising ValueError for the rejected ones).
+
+The results are the same as calling the BankAccount methods for each
+entry in order, including when an account appears more than once in
+one operation.  The hold total of an account is rounded the same as in
+BankAccount: checks are added as they are deposited, and when a check
+clears, the account's other pending checks are summed again in the
+order they were deposited.
+
+Checks are kept in sorted arrays of keys, one int64 per check that packs
+the account id and the check number, so that deposits and clears look
+up all their checks at once with searchsorted.  Check numbers must be
+in 0 to 2**32 - 1.
+
+This module requires numpy, which the rest of the oracle does not use.
+It is listed in requirements-optional.txt.
+"""
+import numpy as np
+
+# bits of a check key that have the check number; the account id is
+# in the bits above them
+NUMBER_BITS = 32
+
+
+class AccountStore:
+    """Balances of many accounts.
+
+    >>> store = AccountStore([1000, 0])
+    >>> store.deposit([0, 1], [10000, 500])
+    array([ True,  True])
+    >>> store.deposit([0], [40000], check_numbers=[1])
+    array([ True])
+    >>> store.available()
+    array([10000.,   500.])
+    >>> store.withdraw([0, 0, 1], [10000, 1, 600])
+    array([ True, False, False])
+    >>> store.clear([0], [1])
+    array([ True])
+    >>> store.available()
+    array([39000.,   500.])
+    >>> store.deposit([1, 1, 0], [5, 5, 5], check_numbers=[7, 7, 1])
+    array([ True, False, False])
+    >>> store.clear([1, 1], [7, 7])
+    array([ True, False])
+    """
+
+    def __init__(self, min_balances=()):
+        """Create a store with one account for each minimum balance."""
+        self.min_balance = np.zeros(0)
+        self.balance = np.zeros(0)
+        self.holds = np.zeros(0)
+        self.pending_count = np.zeros(0, dtype=np.intp)
+        # sorted keys (see check_keys) of pending checks, the amount of
+        # each one, and when it was deposited (a count of deposits)
+        self.pending_keys = np.zeros(0, dtype=np.int64)
+        self.pending_amounts = np.zeros(0)
+        self.pending_order = np.zeros(0, dtype=np.int64)
+        self.deposits = 0
+        # sorted keys of all checks ever deposited
+        self.deposited_checks = np.zeros(0, dtype=np.int64)
+        self.add_accounts(min_balances)
+
+    def __len__(self):
+        return len(self.balance)
+
+    def add_accounts(self, min_balances):
+        """Add accounts with the given minimum balances.
+
+        Returns:
+            array of the ids of the new accounts.
+        """
+        min_balances = np.asarray(min_balances, dtype=float)
+        assert np.all(min_balances >= 0), "min balance parameter must not be negative"
+        first = len(self)
+        self.min_balance = np.concatenate([self.min_balance, min_balances])
+        self.balance = np.concatenate([self.balance, np.zeros(len(min_balances))])
+        self.holds = np.concatenate([self.holds, np.zeros(len(min_balances))])
+        self.pending_count = np.concatenate([self.pending_count,
+                                             np.zeros(len(min_balances), dtype=np.intp)])
+        return np.arange(first, len(self))
+
+    def available(self, ids=None):
+        """Available balance of accounts, as in BankAccount.available.
+
+        Arguments:
+            ids - account ids, default is all accounts.
+        """
+        if ids is None:
+            ids = slice(None)
+        avail = self.balance[ids] - np.maximum(self.min_balance[ids], self.holds[ids])
+        return np.where(avail > 0, avail, 0.0)
+
+    def deposit(self, ids, amounts, check_numbers=None):
+        """Deposit amounts into accounts.
+
+        Arguments:
+            ids - account id of each deposit
+            amounts - amount of each deposit; must be positive
+            check_numbers - if given, each deposit is a check with this
+                number, held until it is cleared; a check that was already
+                deposited in the same account is rejected.
+        Returns:
+            boolean array of deposits that were accepted.
+        """
+        ids = np.asarray(ids, dtype=np.intp)
+        amounts = np.asarray(amounts, dtype=float)
+        accepted = amounts > 0
+        if check_numbers is not None:
+            keys = check_keys(ids, check_numbers)
+            # a check is rejected if it was deposited before, or by an
+            # earlier entry of this operation
+            entries = np.nonzero(accepted)[0]
+            (where, found, first) = find(self.deposited_checks, keys[entries])
+            accepted[entries[found | ~first]] = False
+            order = np.argsort(keys[accepted], kind='stable')
+            added = keys[accepted][order]
+            self.deposited_checks = insert_sorted(self.deposited_checks, added)
+            where = np.searchsorted(self.pending_keys, added)
+            self.pending_keys = np.insert(self.pending_keys, where, added)
+            self.pending_amounts = np.insert(self.pending_amounts, where,
+                                             amounts[accepted][order])
+            self.pending_order = np.insert(self.pending_order, where,
+                                           self.deposits + order)
+            self.deposits += len(added)
+            # the same as adding each check to its account's total in turn
+            np.add.at(self.holds, ids[accepted], amounts[accepted])
+            np.add.at(self.pending_count, ids[accepted], 1)
+        # add.at adds repeated ids one at a time, in order
+        np.add.at(self.balance, ids[accepted], amounts[accepted])
+        return accepted
+
+    def clear(self, ids, check_numbers):
+        """Clear checks deposited in accounts, so their value is available.
+
+        Arguments:
+            ids - account id for each check
+            check_numbers - number of each check to clear
+        Returns:
+            boolean array of checks that were cleared; a check that is
+            not waiting to clear in the account is rejected.
+
+        Available balances are the same as BankAccount's, also when
+        check amounts are fractions:
+
+        >>> import random
+        >>> from bank_correct import BankAccount
+        >>> from money import Money
+        >>> from check import Check
+        >>> rand = random.Random(12)
+        >>> store = AccountStore([0])
+        >>> acct = BankAccount("same")
+        >>> acct.deposit(Money(10000))
+        >>> accepted = store.deposit([0], [10000])
+        >>> checks = [Check(rand.randint(1, 100000) / 100) for n in range(300)]
+        >>> for check in checks:
+        ...     acct.deposit(check)
+        >>> accepted = store.deposit([0] * len(checks), [check.value for check in checks],
+        ...                          check_numbers=[check.check_number for check in checks])
+        >>> same = []
+        >>> for check in rand.sample(checks, len(checks)):
+        ...     acct.clear_check(check)
+        ...     accepted = store.clear([0], [check.check_number])
+        ...     same.append(store.available()[0] == acct.available)
+        >>> all(same), store.available()[0] == acct.available == acct.balance
+        (True, True)
+        """
+        ids = np.asarray(ids, dtype=np.intp)
+        keys = check_keys(ids, check_numbers)
+        (where, found, first) = find(self.pending_keys, keys)
+        # a check cleared twice in one operation is cleared the first time
+        accepted = found & first
+        cleared = ids[accepted]
+        np.subtract.at(self.pending_count, cleared, 1)
+        self.pending_keys = np.delete(self.pending_keys, where[accepted])
+        self.pending_amounts = np.delete(self.pending_amounts, where[accepted])
+        self.pending_order = np.delete(self.pending_order, where[accepted])
+        self.sum_holds(np.unique(cleared))
+        return accepted
+
+    def sum_holds(self, ids):
+        """Sum the pending checks of accounts again, each account's
+        checks in the order they were deposited, as BankAccount does.
+        """
+        if len(ids) == 0:
+            return
+        self.holds[ids] = 0.0
+        entries = np.nonzero(np.isin(self.pending_keys >> NUMBER_BITS, ids))[0]
+        entries = entries[np.argsort(self.pending_order[entries])]
+        np.add.at(self.holds, self.pending_keys[entries] >> NUMBER_BITS,
+                  self.pending_amounts[entries])
+
+    def withdraw(self, ids, amounts):
+        """Withdraw amounts from accounts.
+
+        A withdraw is accepted if the amount is positive and at most the
+        available balance of the account, after earlier withdraws in the
+        same operation.
+
+        Returns:
+            boolean array of withdraws that were accepted.
+        """
+        ids = np.asarray(ids, dtype=np.intp)
+        amounts = np.asarray(amounts, dtype=float)
+        accepted = np.zeros(len(ids), dtype=bool)
+        # withdraws are done in rounds, so that each round has at most
+        # one withdraw from each account, and an account's withdraws are
+        # done in the order given.
+        for entries in rounds(ids):
+            accounts = ids[entries]
+            ok = (amounts[entries] > 0) & (amounts[entries] <= self.available(accounts))
+            self.balance[accounts[ok]] -= amounts[entries[ok]]
+            accepted[entries[ok]] = True
+        return accepted
+
+
+def rounds(ids):
+    """Split positions of ids into rounds: round k has the position of the
+    k-th occurrence of each id.  Yields an array of positions per round.
+    """
+    if len(ids) == 0:
+        return
+    order = np.argsort(ids, kind='stable')
+    sorted_ids = ids[order]
+    starts = np.concatenate([[True], sorted_ids[1:] != sorted_ids[:-1]])
+    first = np.maximum.accumulate(np.where(starts, np.arange(len(ids)), 0))
+    occurrence = np.empty(len(ids), dtype=np.intp)
+    occurrence[order] = np.arange(len(ids)) - first
+    for k in range(occurrence.max() + 1):
+        yield np.nonzero(occurrence == k)[0]
+
+
+def check_keys(ids, check_numbers):
+    """One int64 key for each (account id, check number) pair."""
+    numbers = np.asarray(check_numbers, dtype=np.int64)
+    if len(numbers) and (numbers.min() < 0 or numbers.max() >> NUMBER_BITS):
+        raise ValueError(f"check numbers must be in 0 to 2**{NUMBER_BITS} - 1")
+    return (ids.astype(np.int64) << NUMBER_BITS) | numbers
+
+
+def find(sorted_keys, keys):
+    """Look up keys in a sorted array of keys.
+
+    Returns three arrays: where each key is, or would be inserted, in
+    sorted_keys; whether it is in sorted_keys; and whether it is the
+    first occurrence of that key in keys.
+    """
+    # searchsorted is much faster when the keys it looks up are sorted
+    order = np.argsort(keys, kind='stable')
+    ordered = keys[order]
+    where = np.empty(len(keys), dtype=np.intp)
+    where[order] = np.searchsorted(sorted_keys, ordered)
+    found = np.zeros(len(keys), dtype=bool)
+    inside = where < len(sorted_keys)
+    found[inside] = sorted_keys[where[inside]] == keys[inside]
+    first = np.ones(len(keys), dtype=bool)
+    first[order[1:]] = ordered[1:] != ordered[:-1]
+    return (where, found, first)
+
+
+def insert_sorted(sorted_keys, keys):
+    """Merge sorted keys into a sorted array of keys."""
+    return np.insert(sorted_keys, np.searchsorted(sorted_keys, keys), keys)
@@ -0,0 +1,58 @@
+"""
+Helpers shared by bank_correct.py and bank_bugs.py that keep importing
+them fast.  The student's Money and Check classes are imported the first
+time an account needs them, and threading only for a concurrent account.
+
+A bank module uses them like this:
+
+    from account_support import NO_LOCK, new_lock, load_money, lazy_money
+
+    __getattr__ = lazy_money(globals())
+
+and calls load_money(globals()) when an account is created, so that the
+module's own code can use Money and Check as global names.
+"""
+
+
+class NoLock:
+    """A lock that does nothing, like contextlib.nullcontext()."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+# the lock of an account that is not concurrent
+NO_LOCK = NoLock()
+
+
+def new_lock(concurrent):
+    """A reentrant lock for a concurrent account, else NO_LOCK."""
+    if not concurrent:
+        return NO_LOCK
+    import threading
+    return threading.RLock()
+
+
+def load_money(namespace):
+    """Import Money and Check into a module's globals, if they are not there yet."""
+    if "Check" not in namespace:
+        from money import Money
+        from check import Check
+        namespace.update(Money=Money, Check=Check)
+
+
+def lazy_money(namespace):
+    """A module __getattr__ for the module with globals namespace, which
+    imports Money and Check the first time they are used as attributes
+    of the module, such as bank_account.Money.
+    """
+    def __getattr__(name):
+        if name in ("Money", "Check"):
+            load_money(namespace)
+            return namespace[name]
+        raise AttributeError(f"module {namespace['__name__']!r} has no attribute {name!r}")
+    return __getattr__
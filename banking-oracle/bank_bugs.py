@@ -3,8 +3,10 @@
 Select a bug using environment variable TESTCASE with value 0 ... 7.
 """
 import os
-from money import Money
-from check import Check
+import time
+from bisect import bisect_left, insort
+from account_support import NO_LOCK, new_lock, load_money, lazy_money
+from check_index import CheckIndex, RETENTION
 
 # Constants for errors
 
@@ -25,6 +27,16 @@ BUG_BALANCE_EXCLUDES_HOLDS = 7
 # the minimum balance requirement is not enforced  
 BUG_MINIMUM_IS_IGNORED = 9
 
+# Money and Check are the student's classes.  They are imported by
+# load_money() when the first account is created, and threading only
+# when a concurrent account is created, so importing this module is fast.
+__getattr__ = lazy_money(globals())
+
+# a clear_due() that has at most this many checks scheduled since the
+# last one inserts them in the sorted clear queue one at a time
+FEW_SCHEDULED = 16
+
+
 class BankAccount:
 	"""
 	A BankAccount with a minimum required balance (default is 0)
@@ -36,6 +48,8 @@ class BankAccount:
 	be withdrawn so that a) no not-yet-clear checks are withdrawn, and
 	b) the balance after withdraw is at least the minimum balance. 
 
+	>>> from money import Money
+	>>> from check import Check
 	>>> acct = BankAccount("Taksin Shinawat",1000)  # min required balance is 1,000
 	>>> acct.balance
 	0.0
@@ -73,33 +87,77 @@ class BankAccount:
 	5000.0
 	"""
 
-	def __init__(self, name: str, min_balance: float = 0.0):
+	# set by metrics.instrument() to a function(method, reason) that
+	# counts rejected transactions
+	on_reject = None
+	# gauges that metrics.instrument() adds, as functions of an account
+	metric_gauges = {
+		"pending_checks": lambda account: account.pending_count,
+	}
+
+	def __init__(self, name: str, min_balance: float = 0.0, exact: bool = False,
+				concurrent: bool = False, log=None, check_retention: int = RETENTION):
 		"""Create a new account with given name.
 
 		Args:
 			name - the name for this account
 			min_balance - the minimum required balance, a non-negative number.
 				Default min balance is zero.
+			exact - if True, keep amounts as a whole number of cents, so
+				there is no rounding error.  Amounts are rounded to cents.
+				The properties are still floats.
+			concurrent - if True, the account has a lock so that it can be
+				used by many threads at once.
+			log - an AccountLog (see account_log.py) to record transactions in.
+			check_retention - how many of the newest deposited check numbers
+				are kept in a set; older numbers are kept in a compact
+				sorted array (see check_index.py).
 		"""
 		# you don't need to test min_balance < 0. It's too trivial.
 		assert min_balance >= 0, "min balance parameter must not be negative"
+		load_money(globals())
 		self.__name = name
-		self.__balance = 0.0
 		self.__min_balance = float(min_balance)
-		# checks deposited and waiting to be cleared
-		self.__pending_checks = []
-		self.__deposited_checks = []
+		# amounts are kept in units: cents (int) if exact, else float
+		self.__exact = exact
+		self.__balance = 0 if exact else 0.0
+		self.__min_units = self.__units(self.__min_balance)
+		# checks deposited and waiting to be cleared, in the order deposited.
+		# A check deposited twice (a bug) is waiting to clear twice, so
+		# each deposit has its own key, and pending_keys has the keys
+		# for each check number.
+		self.__pending_checks = {}
+		self.__pending_keys = {}
+		self.__deposit_count = 0
+		# total value of pending checks in units of the balance, or None
+		# when it must be summed again (see __holds)
+		self.__pending_total = 0
+		# numbers of all checks ever deposited
+		self.__deposited_checks = CheckIndex(check_retention)
+		# (-clear after time, -key) of checks deposited with a clear_after
+		# time, sorted so that the next check due is last, and the entries
+		# added since clear_due last sorted it.  Checks cleared by hand
+		# stay in the queue until they are due.
+		self.__clear_queue = []
+		self.__clear_new = []
+		# reentrant, since post_batch and transfer call other methods
+		self.__lock = new_lock(concurrent)
 		# variable for which bug to use
 		self.bug = int(os.getenv('TESTCASE','0'))
+		# AccountLog that transactions are written to, and this account's id in it
+		self.__log = None
+		self.__log_id = None
+		if log is not None:
+			self.set_log(log, log.attach(self))
 	
 	@property
 	def balance(self) -> float:
 		"""Balance in this account (float), as a read-only property"""
 		if self.bug == BUG_BALANCE_EXCLUDES_HOLDS:
-			hold_amount = sum([chk.value for chk in self.__pending_checks])
+			hold_amount = self.__holds()
 		else:
 			hold_amount = 0
-		return self.__balance - hold_amount
+		return self.__value(self.__balance - hold_amount)
 	
 	@property
 	def available(self) -> float:
@@ -109,16 +167,21 @@ class BankAccount:
 		(a) balance becoming less than min_balance, or
 		(b) balance being less than the value of uncleared checks.
 		"""
-		sum_holds = sum(check.value for check in self.__pending_checks)
+		with self.__lock:
+			return self.__value(self.__available())
+
+	def __available(self):
+		"""Available balance in units of the balance."""
+		sum_holds = self.__holds()
 		# the held-back amount is max of min_balance or sum of uncleared checkes
 		if self.bug == BUG_AVAILABLE_BALANCE:
             # available balance computed incorrectly
-			avail = self.__balance - self.min_balance - sum_holds
+			avail = self.__balance - self.__min_units - sum_holds
 		elif self.bug == BUG_MINIMUM_IS_IGNORED:
             # no minimum balance requirement
 			avail = self.__balance - sum_holds
 		else:
-			avail = self.__balance - max(self.min_balance, sum_holds)
+			avail = self.__balance - max(self.__min_units, sum_holds)
 		return avail if (avail>0) else 0.0
 	
 	@property
@@ -126,38 +189,91 @@ class BankAccount:
 		"""Minimum required balance for this account, as read-only property"""
 		return self.__min_balance
 	
+	@property
+	def pending_count(self) -> int:
+		"""Number of deposited checks waiting to clear, as read-only property"""
+		return len(self.__pending_checks)
+
 	@property
 	def account_name(self):
 		"""The account name. Read-only."""
 		return self.__name
+
+	def __rejected(self, method, reason):
+		"""Count a rejected transaction, if metrics are on (see metrics.py).
+		   Called where a transaction is rejected, with or without an exception.
+		"""
+		if self.on_reject is not None:
+			self.on_reject(method, reason)
+
+	def __units(self, value):
+		"""Convert an amount to the units used for the balance.
+
+		In an exact account the units are whole cents, so a long run of
+		deposits and withdraws has no rounding error:
+
+		>>> import random
+		>>> from money import Money
+		>>> rand = random.Random(15)
+		>>> acct = BankAccount("ledger", exact=True)
+		>>> cents = 0
+		>>> for n in range(20000):
+		...     amount = rand.randint(1, 100000)
+		...     if rand.random() < 0.6:
+		...         acct.deposit(Money(amount / 100))
+		...         cents += amount
+		...     elif amount <= cents:
+		...         money = acct.withdraw(amount / 100)
+		...         cents -= amount
+		>>> acct.balance == cents / 100
+		True
+		"""
+		return round(value * 100) if self.__exact else value
+
+	def __value(self, units):
+		"""Convert units of the balance to an amount."""
+		return units / 100 if self.__exact else units
 	
-	def deposit(self, money: Money):
+	def deposit(self, money: 'Money', clear_after: float = None):
 		"""Deposit money or check into the account. 
 		
 		Args:
 			money - Money or Check object with a positive value.
+			clear_after - for a Check, time (as from time.time()) after
+				which clear_due() will clear the check.
 		Raises:
-			ValueError if value of money parameter is not positive.
+			ValueError if value of money parameter is not positive,
+			or if the account is exact and the value is less than a cent.
 		"""
-		if money.value < 0:
+		value = money.value
+		if value < 0 or value == 0 and self.bug != BUG_DEPOSIT_ZERO:
+			self.__rejected("deposit", "not_positive")
 			raise ValueError("Value to deposit must be positive.")
-		if money.value == 0 and self.bug != BUG_DEPOSIT_ZERO:
-			raise ValueError("Value to deposit must be positive.")
-		elif money.value == 0:
-			print(f"Allow deposit of 0 due to defect {self.bug}")
-		# if it is a check, verify the check was not already deposited
-		if isinstance(money, Check):
-			# looks like a check
-			if money in self.__deposited_checks:
-				if self.bug != BUG_DUPLICATE_CHECK:
-					raise ValueError("Check already deposited")
-			# add to list of checking waiting to clear
-			self.__pending_checks.append(money)
-			self.__deposited_checks.append(money)
-		# both cash and checks contribute to the balance
-		self.__balance += money.value
-
-	def clear_check(self, check: Check):
+		units = round(value * 100) if self.__exact else value
+		if units == 0 and value != 0:
+			self.__rejected("deposit", "below_one_cent")
+			raise ValueError("Cannot deposit less than one cent")
+		with self.__lock:
+			# if it is a check, verify the check was not already deposited
+			if isinstance(money, Check):
+				# looks like a check
+				if money.check_number in self.__deposited_checks:
+					if self.bug != BUG_DUPLICATE_CHECK:
+						self.__rejected("deposit", "duplicate_check")
+						raise ValueError("Check already deposited")
+				# add to checks waiting to clear
+				self.__deposit_count += 1
+				self.__pending_checks[self.__deposit_count] = money
+				self.__pending_keys.setdefault(money.check_number, []).append(self.__deposit_count)
+				self.__add_hold(units)
+				self.__deposited_checks.add(money.check_number)
+				if clear_after is not None:
+					self.__clear_new.append((-clear_after, -self.__deposit_count))
+			# both cash and checks contribute to the balance
+			self.__balance += units
+			self.__record("deposit", money, clear_after)
+
+	def clear_check(self, check: 'Check'):
 		"""Mark a check as cleared so it is available for withdraw.
 
 		Args:
@@ -166,38 +282,417 @@ class BankAccount:
 		Raises:
 			ValueError if the check isn't in the list of checks waiting to clear
 		"""
-		if check in self.__pending_checks:
-			self.__pending_checks.remove(check)
-		elif self.bug != BUG_CLEAR_ANY_CHECK:
-			raise ValueError(f"Check {check.check_number} is not an uncleared check")
+		with self.__lock:
+			keys = self.__pending_keys.get(check.check_number)
+			if keys:
+				# clear the earliest deposit of this check
+				key = keys.pop(0)
+				if not keys:
+					del self.__pending_keys[check.check_number]
+				self.__remove_holds((self.__pending_checks.pop(key),))
+				self.__record("clear", check)
+			elif self.bug != BUG_CLEAR_ANY_CHECK:
+				self.__rejected("clear_check", "not_pending")
+				raise ValueError(f"Check {check.check_number} is not an uncleared check")
 		
 	
-	def withdraw(self, amount: float) -> Money:
+	def __holds(self):
+		"""Total value of pending checks, in units of the balance.
+
+		An exact account keeps the total in cents.  Otherwise the total
+		is kept while checks are deposited, but after a check is cleared
+		the other checks are summed again, in the order they were
+		deposited, so the total is rounded the same as the sum of the
+		pending checks that available has always used.
+
+		>>> from money import Money
+		>>> from check import Check
+		>>> acct = BankAccount("sums")
+		>>> acct.deposit(Money(100))
+		>>> checks = [Check(5), Check(0.1), Check(0.2), Check(0.3)]
+		>>> for check in checks:
+		...     acct.deposit(check)
+		>>> acct.clear_check(checks[0])
+		>>> acct.available == acct.balance - (0.1 + 0.2 + 0.3)
+		True
+		"""
+		if self.__pending_total is None:
+			self.__pending_total = sum(check.value for check in self.__pending_checks.values())
+		return self.__pending_total
+
+	def __add_hold(self, units):
+		"""Add the value of a deposited check, in units of the balance,
+		   to the pending total.
+		"""
+		if self.__pending_total is not None:
+			self.__pending_total += units
+
+	def __remove_holds(self, checks):
+		"""Remove the values of cleared checks from the pending total.
+
+		>>> from money import Money
+		>>> from check import Check
+		>>> acct = BankAccount("cents")
+		>>> acct.deposit(Money(100))
+		>>> checks = [Check(0.1), Check(0.2), Check(0.3)]
+		>>> for check in checks:
+		...     acct.deposit(check)
+		>>> acct.clear_check(checks[1])
+		>>> acct.available == acct.balance - (0.1 + 0.3)
+		True
+		>>> acct.clear_check(checks[0])
+		>>> acct.clear_check(checks[2])
+		>>> acct.available == acct.balance
+		True
+		"""
+		if self.__exact:
+			for check in checks:
+				self.__pending_total -= round(check.value * 100)
+		elif checks:
+			self.__pending_total = None
+
+	def clear_due(self, now: float = None) -> list:
+		"""Clear all checks whose clear_after time is at or before now.
+
+		Args:
+			now - the time, default is time.time()
+		Returns:
+			list of the checks that were cleared, in the order they were due.
+
+		>>> from money import Money
+		>>> from check import Check
+		>>> acct = BankAccount("cents", exact=True)
+		>>> acct.deposit(Money(10))
+		>>> for (value, due) in [(0.07, 5), (12.345, 5), (0.01, 8), (1.99, 20)]:
+		...     acct.deposit(Check(value), clear_after=due)
+		>>> acct.available
+		10.0
+		>>> [check.value for check in acct.clear_due(now=5)]
+		[0.07, 12.345]
+		>>> acct.available
+		22.41
+		>>> [check.value for check in acct.clear_due(now=10)]
+		[0.01]
+		>>> [check.value for check in acct.clear_due(now=30)]
+		[1.99]
+		>>> acct.available == acct.balance
+		True
+		"""
+		if now is None:
+			now = time.time()
+		cleared = []
+		with self.__lock:
+			self.__sort_clear_queue()
+			queue = self.__clear_queue
+			# the due checks are the end of the queue, latest first
+			start = bisect_left(queue, (-now,))
+			due = queue[start:]
+			del queue[start:]
+			for (_, negative_key) in reversed(due):
+				key = -negative_key
+				check = self.__pending_checks.pop(key, None)
+				# None if it was already cleared
+				if check is None:
+					continue
+				keys = self.__pending_keys[check.check_number]
+				keys.remove(key)
+				if not keys:
+					del self.__pending_keys[check.check_number]
+				cleared.append(check)
+			self.__remove_holds(cleared)
+			if cleared and self.__log is not None:
+				self.__log.clear_due(self.__log_id, now)
+		return cleared
+
+	def __sort_clear_queue(self):
+		"""Move the checks scheduled since the last clear_due into the
+		   sorted clear queue.  A few are inserted one at a time; more
+		   are appended and the queue sorted, which merges them with the
+		   sorted entries in one pass.
+		"""
+		new = self.__clear_new
+		if not new:
+			return
+		queue = self.__clear_queue
+		if len(new) <= FEW_SCHEDULED:
+			for entry in new:
+				insort(queue, entry)
+		else:
+			queue += new
+			queue.sort()
+		new.clear()
+
+	def withdraw(self, amount: float) -> 'Money':
 		"""
 		Withdraw an amount from the account. 
 
 		Args:
 			amount - (number) the amount to withdraw, at most the available balance
 		Returns:
-			a Money object for the amount requested.
+			a Money object for the amount requested.  If the account is
+			exact, the amount is rounded to cents.
 		Raises:
-			 ValueError if amount exceeds available balance or is not positive.
+			 ValueError if amount exceeds available balance or is not positive,
+			 or if the account is exact and the amount is less than a cent.
+
+		>>> from money import Money
+		>>> acct = BankAccount("cents", exact=True)
+		>>> acct.deposit(Money(10))
+		>>> acct.withdraw(0.004)
+		Traceback (most recent call last):
+		   ...
+		ValueError: Amount to withdraw is less than one cent
+		>>> acct.deposit(Money(0.004))
+		Traceback (most recent call last):
+		   ...
+		ValueError: Cannot deposit less than one cent
+		>>> acct.withdraw(2.456)
+		Money(2.46)
+		>>> acct.balance
+		7.54
 		"""
 		if amount <= 0:
+			self.__rejected("withdraw", "not_positive")
 			raise ValueError("Amount to withdraw must be positive") 
-		if amount > self.available:
-			if self.bug == BUG_WITHDRAW_FAILS_SILENTLY:
-				return None
-			raise ValueError(f"Amount exceeds available balance")
-		if amount == self.available and self.bug == BUG_CANT_WITHDRAW_AVAILABLE:
-			# bug: you cannot withdraw exactly the available balance 
-			raise ValueError(f"Amount exceeds available balance")
-		# try to create the money before deducting from balance,
-		# in case Money throws an exception.
-		m = Money(amount)
-		self.__balance -= amount
+		if self.__exact:
+			units = round(amount * 100)
+			if units == 0:
+				self.__rejected("withdraw", "below_one_cent")
+				raise ValueError("Amount to withdraw is less than one cent")
+			amount = units / 100
+		else:
+			units = amount
+		with self.__lock:
+			if units > self.__available():
+				if self.bug == BUG_WITHDRAW_FAILS_SILENTLY:
+					self.__rejected("withdraw", "exceeds_available")
+					return None
+				self.__rejected("withdraw", "exceeds_available")
+				raise ValueError(f"Amount exceeds available balance")
+			if units == self.__available() and self.bug == BUG_CANT_WITHDRAW_AVAILABLE:
+				# bug: you cannot withdraw exactly the available balance 
+				self.__rejected("withdraw", "exceeds_available")
+				raise ValueError(f"Amount exceeds available balance")
+			# try to create the money before deducting from balance,
+			# in case Money throws an exception.
+			m = Money(amount)
+			self.__balance -= units
+			self.__record("withdraw", amount)
 		return m 
 	
+	def post_batch(self, transactions, atomic: bool = False) -> list:
+		"""Apply a batch of transactions to the account, in order.
+
+		Args:
+			transactions - iterable of (action, argument) pairs, where action
+				is "deposit" (argument is Money or a Check), "clear" (a Check)
+				or "withdraw" (an amount).
+			atomic - if True, apply all the transactions or none of them.
+		Returns:
+			a list with the outcome of each transaction: what the method
+			returned (Money for a withdraw, else None), or the exception
+			it raised.  An atomic batch stops at the first exception and
+			restores the account to its state before the batch, so the
+			list ends with that exception.  An entry that is not an
+			(action, argument) pair fails like a transaction does.
+
+		>>> from money import Money
+		>>> from check import Check
+		>>> acct = BankAccount("batch")
+		>>> acct.deposit(Money(100))
+		>>> old, new = Check(20), Check(50)
+		>>> acct.deposit(old)
+		>>> acct.post_batch([("clear", old), ("deposit", new), ("withdraw", 30),
+		...                  ("withdraw",)], atomic=True)
+		[None, None, Money(30), ValueError('not enough values to unpack (expected 2, got 1)')]
+		>>> acct.balance, acct.available, acct.pending_count
+		(120.0, 100.0, 1)
+		>>> acct.post_batch([("deposit", new), ("clear", old)], atomic=True)
+		[None, None]
+		>>> acct.balance, acct.available, acct.pending_count
+		(170.0, 120.0, 1)
+		"""
+		actions = {"deposit": self.deposit, "clear": self.clear_check,
+					"withdraw": self.withdraw}
+		with self.__lock:
+			if atomic:
+				# to undo the batch: the totals, the pending deposits of
+				# each check number that the batch deposits or clears, and
+				# checks deposited for the first time in this batch
+				saved = (self.__balance, self.__deposit_count, self.__pending_total)
+				touched = {}
+				new_checks = []
+				# the batch is logged after all of it is applied
+				log, self.__log = self.__log, None
+				applied = []
+			outcomes = []
+			try:
+				for entry in transactions:
+					try:
+						try:
+							(action, argument) = entry
+						except (TypeError, ValueError):
+							self.__rejected("post_batch", "malformed")
+							raise
+						if action not in actions:
+							self.__rejected("post_batch", "unknown_action")
+							raise ValueError(f"Unknown transaction {action}")
+						if atomic and (action == "clear" or
+								action == "deposit" and isinstance(argument, Check)):
+							number = argument.check_number
+							if number not in touched:
+								touched[number] = {key: self.__pending_checks[key]
+									for key in self.__pending_keys.get(number, ())}
+							if action == "deposit" and number not in self.__deposited_checks:
+								new_checks.append(number)
+						outcomes.append(actions[action](argument))
+						if atomic:
+							applied.append((action, argument))
+					except Exception as ex:
+						outcomes.append(ex)
+						if atomic:
+							self.__undo_batch(saved, touched, new_checks)
+							break
+			except BaseException:
+				# the transactions iterable raised
+				if atomic:
+					self.__undo_batch(saved, touched, new_checks)
+				raise
+			finally:
+				if atomic:
+					self.__log = log
+			if atomic and len(applied) == len(outcomes):
+				for (action, argument) in applied:
+					self.__record(action, argument)
+		return outcomes
+
+	def __undo_batch(self, saved, touched, new_checks):
+		"""Restore the state saved by an atomic post_batch."""
+		# deposits made by the batch have keys after the saved count
+		for key in range(saved[1] + 1, self.__deposit_count + 1):
+			self.__pending_checks.pop(key, None)
+		(self.__balance, self.__deposit_count, self.__pending_total) = saved
+		reordered = False
+		for (number, deposits) in touched.items():
+			if deposits:
+				self.__pending_keys[number] = list(deposits)
+				reordered |= any(key not in self.__pending_checks for key in deposits)
+				self.__pending_checks.update(deposits)
+			else:
+				self.__pending_keys.pop(number, None)
+		if reordered:
+			# put cleared checks back in the order they were deposited,
+			# which is the order holds are summed in (see __holds)
+			self.__pending_checks = dict(sorted(self.__pending_checks.items()))
+		self.__deposited_checks.difference_update(new_checks)
+
+	@staticmethod
+	def transfer(src: 'BankAccount', dst: 'BankAccount', amount: float) -> 'Money':
+		"""Withdraw an amount from one account and deposit it in another,
+		as one operation.
+
+		Both accounts are locked while the transfer is done.  Locks are
+		always taken in the same order, so two transfers between the same
+		accounts in opposite directions cannot deadlock.
+
+		Args:
+			src - account to withdraw from
+			dst - account to deposit to
+			amount - (number) the amount to transfer
+		Returns:
+			the Money that was transferred, or None if src.withdraw
+			returned None.
+		Raises:
+			ValueError if src cannot withdraw the amount.  Neither account
+			is changed.
+
+		If dst cannot take the deposit, src gets back the exact balance
+		it had, not the balance minus amount plus amount:
+
+		>>> from money import Money
+		>>> src, dst = BankAccount("src"), BankAccount("dst", exact=True)
+		>>> src.deposit(Money(0.01))
+		>>> BankAccount.transfer(src, dst, 0.001)
+		Traceback (most recent call last):
+		   ...
+		ValueError: Cannot deposit less than one cent
+		>>> src.balance == 0.01, (0.01 - 0.001) + 0.001 == 0.01
+		(True, False)
+		"""
+		first, second = sorted((src, dst), key=id)
+		with first.__lock, second.__lock:
+			balance = src.__balance
+			money = src.withdraw(amount)
+			if money is None:
+				return None
+			try:
+				dst.deposit(money)
+			except Exception:
+				src._refund(balance)
+				raise
+		return money
+
+	def _refund(self, balance):
+		"""Restore the balance from before a transfer withdrew an amount
+		   that it could not deposit.  balance is in the units of the
+		   balance (cents if exact), so it comes back exactly.  Used by
+		   transfer(), and by account_log.recover() to replay a logged refund.
+		"""
+		with self.__lock:
+			self.__balance = balance
+			self.__record("refund", balance)
+
+	def set_log(self, log, log_id: int):
+		"""Write later transactions to an AccountLog, as account log_id.
+
+		Args:
+			log - the AccountLog, or None to stop logging
+			log_id - id of this account in the log
+		"""
+		self.__log = log
+		self.__log_id = log_id
+
+	def __record(self, action, argument, clear_after=None):
+		"""Write a transaction to the log, if the account has a log.
+		   action and argument are as in post_batch.
+		"""
+		log = self.__log
+		if log is None:
+			return
+		if action == "deposit" and isinstance(argument, Check):
+			log.deposit_check(self.__log_id, argument, clear_after)
+		elif action == "deposit":
+			log.deposit(self.__log_id, argument.value)
+		elif action == "clear":
+			log.clear(self.__log_id, argument.check_number)
+		elif action == "refund":
+			log.refund(self.__log_id, argument)
+		else:
+			log.withdraw(self.__log_id, argument)
+
+	def __getstate__(self):
+		"""State of the account for pickle, as a tuple.
+		   The lock and the log are not included.
+		"""
+		with self.__lock:
+			return (self.__name, self.__min_balance, self.__exact, self.__balance,
+				self.__min_units, self.__pending_checks, self.__pending_keys,
+				self.__deposit_count, self.__pending_total, self.__deposited_checks,
+				self.__clear_queue, self.__clear_new, self.bug, self.__lock is not NO_LOCK)
+
+	def __setstate__(self, state):
+		"""Restore an account pickled with __getstate__.
+		   The account has no log until set_log is called.
+		"""
+		(self.__name, self.__min_balance, self.__exact, self.__balance,
+			self.__min_units, self.__pending_checks, self.__pending_keys,
+			self.__deposit_count, self.__pending_total, self.__deposited_checks,
+			self.__clear_queue, self.__clear_new, self.bug, concurrent) = state
+		self.__lock = new_lock(concurrent)
+		load_money(globals())
+		self.__log = None
+		self.__log_id = None
+
 	def __str__(self):
 		"""String representation of the bank account.
 		   Includes the acct name but not the balance.
@@ -205,6 +700,9 @@ class BankAccount:
 		return f"{self.account_name} Account"
 
 
+transfer = BankAccount.transfer
+
+
 def config(envvar, default="", cast=None):
     """Like decouple.config, read a variable from the environment, 
     with optional casting.  This is so we don't require the decouple package.
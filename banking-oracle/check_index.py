@@ -0,0 +1,130 @@
+"""
+Set of the numbers of checks deposited in an account, which uses
+little memory when it has many numbers.
+
+The most recently added numbers are kept in a set.  When the set has
+`retention` numbers, they are sorted into an array of int64, which takes
+8 bytes per number.  Arrays are merged like a binary counter, so there
+are at most about log2(n / retention) arrays and each number is merged
+O(log n) times.  A lookup checks the set and does a binary search of
+each array whose range includes the number.  Check numbers usually
+increase, so a new number is rejected by comparing it with the largest
+number in all the arrays.
+
+All lookups are exact.  Numbers that do not fit in an int64 (or are not
+ints) are always kept in a set.
+
+>>> index = CheckIndex(retention=2)
+>>> for number in (5, 1, 9, 3):
+...     index.add(number)
+>>> 3 in index, 4 in index, "CHK-1" in index
+(True, False, False)
+>>> index.add("CHK-1")
+>>> len(index), "CHK-1" in index
+(5, True)
+"""
+import sys
+from bisect import bisect_left
+
+# default number of recent check numbers kept in a set
+RETENTION = 1024
+
+INT64_MIN = -2**63
+INT64_MAX = 2**63 - 1
+
+
+class CheckIndex:
+    """Set of check numbers, with only add, discard and membership."""
+
+    __slots__ = ('retention', 'recent', 'runs', 'high', 'other')
+
+    def __init__(self, retention=RETENTION, numbers=()):
+        """Create an index.
+
+        Arguments:
+            retention - how many of the newest numbers are kept in a set
+                before they are moved to a sorted array.
+            numbers - numbers to add to the index
+        """
+        assert retention > 0, "retention must be positive"
+        self.retention = retention
+        self.recent = set()
+        # sorted arrays of older numbers, largest array first
+        self.runs = []
+        # no number in the arrays is larger than high
+        self.high = INT64_MIN
+        # numbers that are not int64
+        self.other = set()
+        for number in numbers:
+            self.add(number)
+
+    def __contains__(self, number):
+        if type(number) is not int or not INT64_MIN <= number <= INT64_MAX:
+            return number in self.other
+        if number in self.recent:
+            return True
+        if number > self.high:
+            return False
+        for run in self.runs:
+            if run[0] <= number <= run[-1]:
+                k = bisect_left(run, number)
+                if run[k] == number:
+                    return True
+        return False
+
+    def __len__(self):
+        return len(self.recent) + sum(len(run) for run in self.runs) + len(self.other)
+
+    def __iter__(self):
+        yield from self.other
+        for run in self.runs:
+            yield from run
+        yield from self.recent
+
+    def __sizeof__(self):
+        """Size in bytes of the index and the sets and arrays it has,
+           not including the int objects in the sets.
+        """
+        return (object.__sizeof__(self) + sys.getsizeof(self.recent) + sys.getsizeof(self.other)
+                + sys.getsizeof(self.runs) + sum(sys.getsizeof(run) for run in self.runs))
+
+    def add(self, number):
+        """Add a number to the index, if it is not already there."""
+        if type(number) is not int or not INT64_MIN <= number <= INT64_MAX:
+            self.other.add(number)
+        elif number not in self:
+            self.recent.add(number)
+            if len(self.recent) >= self.retention:
+                self.compact()
+
+    def compact(self):
+        """Move the recent numbers to a sorted array."""
+        # imported here, since most accounts never have enough checks
+        from array import array
+        run = array('q', sorted(self.recent))
+        self.recent = set()
+        while self.runs and len(self.runs[-1]) <= len(run):
+            # sorted() finds the two sorted parts, so this is a merge
+            run = array('q', sorted(self.runs.pop() + run))
+        self.runs.append(run)
+        self.high = max(self.high, run[-1])
+
+    def discard(self, number):
+        """Remove a number from the index, if it is there."""
+        if type(number) is not int or not INT64_MIN <= number <= INT64_MAX:
+            self.other.discard(number)
+        elif number in self.recent:
+            self.recent.remove(number)
+        else:
+            for run in self.runs:
+                k = bisect_left(run, number)
+                if k < len(run) and run[k] == number:
+                    del run[k]
+                    if not run:
+                        self.runs.remove(run)
+                    return
+
+    def difference_update(self, numbers):
+        """Remove numbers from the index, like set.difference_update."""
+        for number in numbers:
+            self.discard(number)
@@ -0,0 +1,57 @@
+"""
+Throughput benchmark for AuctionHouse with 1, 2, 4 and 8 shards.
+
+Creates many items, then submits bids for random items in batches
+with AuctionHouse.bid_many() and reports bids per second.
+
+Usage: python3 bench_auction_house.py [items] [bids]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'auction-oracle'))
+from auction_house import AuctionHouse
+
+SHARD_COUNTS = [1, 2, 4, 8]
+BATCH_SIZE = 20000
+
+
+def make_bids(items, count, seed=1):
+    """Random bids for random items, each higher than the item's last bid."""
+    rand = random.Random(seed)
+    best = [0] * len(items)
+    bids = []
+    for n in range(count):
+        k = rand.randrange(len(items))
+        best[k] += rand.randint(1, 10)
+        bids.append((items[k], f"bidder {rand.randrange(1000)}", best[k]))
+    return bids
+
+
+def run(shards, items, bids):
+    """Return (bids per second, top item) for one trial."""
+    with AuctionHouse(shards=shards, testcase=1) as house:
+        for item in items:
+            house.add(item)
+            house.start(item)
+        start = time.perf_counter()
+        for n in range(0, len(bids), BATCH_SIZE):
+            rejected = house.bid_many(bids[n:n+BATCH_SIZE])
+            assert not rejected, rejected[:3]
+        elapsed = time.perf_counter() - start
+        return len(bids) / elapsed, house.top(1)
+
+
+def main(items=10000, bids=1000000):
+    items = [f"item {n}" for n in range(items)]
+    bids = make_bids(items, bids)
+    print(f"{'shards':>6}{'bids/sec':>14}  top item")
+    for shards in SHARD_COUNTS:
+        rate, top = run(shards, items, bids)
+        print(f"{shards:>6}{rate:>14,.0f}  {top}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,89 @@
+"""
+Compare the Auction bid ladder with sorting the bids on demand for
+top(10), rank(), runner_up() and bids_between() queries, and show the
+cost of keeping the ladder up to date as bids arrive.
+
+Usage: python3 bench_auction_ladder.py [bidders] [queries]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'auction-oracle'))
+from auction import Auction
+
+
+def place_bids(auction, bids):
+    start = time.perf_counter()
+    for (name, amount) in bids:
+        auction.bid(name, amount)
+    return time.perf_counter() - start
+
+
+def sorted_bids(auction):
+    """The bids sorted best first, as a caller without the ladder does."""
+    return sorted(((amount, bidder) for (bidder, amount) in auction.bids.items()
+                   if bidder != "no bids"), key=lambda bid: -bid[0])
+
+
+def on_demand_queries(auction, names, low, high):
+    """The same queries as the ladder answers, each by sorting all bids."""
+    return {
+        "top(10)": lambda n: sorted_bids(auction)[:10],
+        "rank": lambda n: [bidder for (amount, bidder) in sorted_bids(auction)].index(names[n]) + 1,
+        "runner_up": lambda n: sorted_bids(auction)[1],
+        "bids_between": lambda n: [bid for bid in sorted_bids(auction) if low <= bid[0] <= high],
+    }
+
+
+def ladder_queries(auction, names, low, high):
+    return {
+        "top(10)": lambda n: auction.top(10),
+        "rank": lambda n: auction.rank(names[n]),
+        "runner_up": lambda n: auction.runner_up(),
+        "bids_between": lambda n: auction.bids_between(low, high),
+    }
+
+
+def timed(query, count, names):
+    """Microseconds per query."""
+    start = time.perf_counter()
+    for n in range(count):
+        query(n % len(names))
+    return 1e6 * (time.perf_counter() - start) / count
+
+
+def main(bidders=100000, queries=200):
+    rand = random.Random(1)
+    names = [f"Bidder {n}" for n in range(bidders)]
+    # bids rise slowly, with many bidders raising their own bids
+    bids = []
+    amount = 0
+    for n in range(2 * bidders):
+        amount += rand.randint(1, 3)
+        bids.append((names[rand.randrange(bidders)] if n >= bidders else names[n], amount))
+    plain = Auction("plain")
+    plain.start()
+    laddered = Auction("ladder")
+    laddered.start()
+    laddered.bid_ladder()
+    elapsed_plain = place_bids(plain, bids)
+    elapsed_ladder = place_bids(laddered, bids)
+    print(f"{len(bids):,} bids by {bidders:,} bidders")
+    print(f"bid() without ladder {1e6 * elapsed_plain / len(bids):8.2f} usec")
+    print(f"bid() with ladder    {1e6 * elapsed_ladder / len(bids):8.2f} usec")
+    low, high = amount // 2, amount // 2 + 1000
+    names = [Auction.normalize(name) for name in rand.sample(names, min(queries, bidders))]
+    on_demand = on_demand_queries(plain, names, low, high)
+    ladder = ladder_queries(laddered, names, low, high)
+    print(f"{'query':<14}{'sort usec':>14}{'ladder usec':>14}{'speedup':>10}")
+    for name in ladder:
+        assert on_demand[name](0) == ladder[name](0), name
+        sort_time = timed(on_demand[name], max(1, queries // 20), names)
+        ladder_time = timed(ladder[name], queries, names)
+        print(f"{name:<14}{sort_time:>14.1f}{ladder_time:>14.2f}{sort_time / ladder_time:>10.0f}x")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
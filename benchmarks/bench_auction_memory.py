@@ -0,0 +1,60 @@
+"""
+Memory used by Auction objects, measured with tracemalloc.
+
+Reports bytes per empty auction, bytes per bid in Auction.bids
+(one entry per distinct bidder), and bytes per bid in a BidHistory
+(every accepted bid) for distinct and for repeat bidders.
+
+Usage: python3 bench_auction_memory.py [auctions] [bids]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'auction-oracle'))
+from auction import Auction, profile_for
+
+PROFILE = profile_for(1)
+
+
+def measure(build):
+    """Return (bytes allocated by build(), result of build)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def make_auctions(count):
+    return [Auction(f"item {n}", profile=PROFILE) for n in range(count)]
+
+
+def make_bids(names, count, history):
+    auction = Auction("item", profile=PROFILE, history=history)
+    auction.start()
+    for n in range(count):
+        auction.bid(names[n % len(names)], n + 1)
+    return auction
+
+
+def main(auctions=100000, bids=100000):
+    size, result = measure(lambda: make_auctions(auctions))
+    print(f"bytes per auction (no bids):        {size / auctions:8.1f}")
+    del result
+    # names are created before measuring, so only the storage is counted
+    distinct = [Auction.normalize(f"bidder {n}") for n in range(bids)]
+    repeat = distinct[:100]
+    for (label, names) in (("distinct bidders", distinct), ("100 repeat bidders", repeat)):
+        plain, result = measure(lambda: make_bids(names, bids, False))
+        del result
+        recorded, result = measure(lambda: make_bids(names, bids, True))
+        del result
+        print(f"{label}:")
+        print(f"  bytes per bid in bids dict:       {plain / bids:8.1f}")
+        print(f"  bytes per bid added by history:   {(recorded - plain) / bids:8.1f}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
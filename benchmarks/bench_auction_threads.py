@@ -0,0 +1,88 @@
+"""
+Stress benchmark for Auction(concurrent=True).
+
+Many threads bid against each other on one auction. Reports bids per
+second as the number of threads grows, and verifies that the sequence
+of accepted bids always increases by at least the bid increment.
+
+Usage: python3 bench_auction_threads.py [bids_per_thread]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'auction-oracle'))
+from auction import Auction, AuctionError, profile_for
+
+THREAD_COUNTS = [1, 2, 4, 8, 16]
+
+
+class RecordingAuction(Auction):
+    """An Auction that remembers every accepted bid, in order.
+       record_bid() is called while holding the auction's lock,
+       so the order of the list is the order bids were accepted.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accepted = []
+
+    def record_bid(self, bidder_name, amount):
+        self.accepted.append(amount)
+        super().record_bid(bidder_name, amount)
+
+
+def bidder(auction, name, count):
+    """Bid count times, each time just above the best bid seen."""
+    for n in range(count):
+        amount = auction.best_bid() + auction.increment
+        try:
+            auction.bid(name, amount)
+        except AuctionError:
+            pass
+
+
+def violations(accepted, increment):
+    """Count accepted bids that did not exceed the previous by increment."""
+    return sum(1 for (prev, amount) in zip(accepted, accepted[1:])
+               if amount < prev + increment)
+
+
+def run(threads, bids_per_thread, concurrent=True):
+    """Run one trial. Returns (bids per second, accepted, violations)."""
+    auction = RecordingAuction("stress", concurrent=concurrent,
+                               profile=profile_for(1))
+    auction.start()
+    workers = [threading.Thread(target=bidder,
+                                args=(auction, f"bidder {n}", bids_per_thread))
+               for n in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    rate = threads * bids_per_thread / elapsed
+    return (rate, len(auction.accepted),
+            violations(auction.accepted, auction.increment))
+
+
+def main(bids_per_thread=20000):
+    # switch threads often, so that unlocked check-then-write races show up
+    sys.setswitchinterval(1e-6)
+    print(f"{'mode':<12}{'threads':>8}{'bids/sec':>12}{'accepted':>10}{'violations':>12}")
+    failed = False
+    for concurrent in (True, False):
+        mode = "concurrent" if concurrent else "unlocked"
+        for threads in THREAD_COUNTS:
+            rate, accepted, bad = run(threads, bids_per_thread, concurrent)
+            print(f"{mode:<12}{threads:>8}{rate:>12,.0f}{accepted:>10}{bad:>12}")
+            if concurrent and bad:
+                failed = True
+    if failed:
+        print("FAIL: concurrent mode accepted a bid that was too low")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*map(int, sys.argv[1:])))
@@ -0,0 +1,87 @@
+"""
+Compare BankAccount.post_batch() with calling deposit(), clear_check()
+and withdraw() one at a time in a loop.
+
+Needs money.py and check.py on the module search path, as the
+banking-oracle tests do.
+
+Usage: python3 bench_bank_batch.py [transactions]
+"""
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'banking-oracle'))
+from bank_correct import BankAccount
+from money import Money
+from check import Check
+
+
+def make_transactions(count, seed=1):
+    """Random deposits of cash and checks, clears, and withdraws."""
+    rand = random.Random(seed)
+    pending = []
+    transactions = []
+    for n in range(count):
+        r = rand.random()
+        if r < 0.3:
+            transactions.append(("deposit", Money(rand.randint(1, 1000))))
+        elif r < 0.6:
+            check = Check(rand.randint(1, 1000))
+            pending.append(check)
+            transactions.append(("deposit", check))
+        elif r < 0.8 and pending:
+            transactions.append(("clear", pending.pop(rand.randrange(len(pending)))))
+        else:
+            transactions.append(("withdraw", rand.randint(1, 500)))
+    return transactions
+
+
+def post_singly(account, transactions):
+    """Apply transactions by calling each method, catching exceptions."""
+    actions = {"deposit": account.deposit, "clear": account.clear_check,
+               "withdraw": account.withdraw}
+    outcomes = []
+    for (action, argument) in transactions:
+        try:
+            outcomes.append(actions[action](argument))
+        except ValueError as ex:
+            outcomes.append(ex)
+    return outcomes
+
+
+def timed(function, *args):
+    """Return (elapsed seconds, result) of calling function(*args)."""
+    gc.collect()
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def post_atomic(account, transactions, size=1000):
+    """Apply transactions in atomic batches of size transactions."""
+    for n in range(0, len(transactions), size):
+        account.post_batch(transactions[n:n+size], atomic=True)
+
+
+def main(count=1000000):
+    transactions = make_transactions(count)
+    single = BankAccount("single", 100)
+    batch = BankAccount("batch", 100)
+    atomic = BankAccount("atomic", 100)
+    elapsed_single, outcomes = timed(post_singly, single, transactions)
+    elapsed_batch, batch_outcomes = timed(batch.post_batch, transactions)
+    # atomic batches of 1000, as a ledger would post them
+    elapsed_atomic, result = timed(post_atomic, atomic, transactions)
+    assert batch.balance == single.balance and batch.available == single.available
+    assert len(batch_outcomes) == len(outcomes)
+    for (label, elapsed) in (("single calls", elapsed_single),
+                             ("post_batch", elapsed_batch),
+                             ("post_batch atomic x1000", elapsed_atomic)):
+        print(f"{label:<26}{elapsed:8.3f} sec {count / elapsed:>12,.0f} transactions/sec")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,66 @@
+"""
+Memory and deposit time of duplicate-check detection in BankAccount, as
+the number of checks deposited in an account grows.
+
+Compares the CheckIndex with the default retention to a retention
+larger than the number of checks, so every number stays in a set as
+before.  Each check is cleared after it is deposited, so the memory
+that remains is what the account keeps to reject duplicates.
+
+Needs money.py and check.py on the module search path.
+
+Usage: python3 bench_bank_checks.py [max_checks]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'banking-oracle'))
+from bank_correct import BankAccount
+from check_index import RETENTION
+from check import Check
+
+# deposits timed at the end of each run
+TIMED = 10000
+
+
+def deposit_checks(account, count):
+    """Deposit and clear count checks. Returns the time of the last TIMED."""
+    for n in range(count - TIMED):
+        check = Check(1)
+        account.deposit(check)
+        account.clear_check(check)
+    checks = [Check(1) for n in range(TIMED)]
+    start = time.perf_counter()
+    for check in checks:
+        account.deposit(check)
+    elapsed = time.perf_counter() - start
+    for check in checks:
+        account.clear_check(check)
+    return elapsed
+
+
+def memory_used(retention, count):
+    """Memory kept by an account after count checks."""
+    tracemalloc.start()
+    account = BankAccount("memory", check_retention=retention)
+    deposit_checks(account, count)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used
+
+
+def main(max_checks=1000000):
+    print(f"{'checks':>10}{'store':>8}{'bytes/account':>16}{'usec/deposit':>14}")
+    count = 10 * TIMED
+    while count <= max_checks:
+        for (label, retention) in (("set", count + 1), ("index", RETENTION)):
+            elapsed = deposit_checks(BankAccount("time", check_retention=retention), count)
+            used = memory_used(retention, count)
+            print(f"{count:>10,}{label:>8}{used:>16,}{1e6 * elapsed / TIMED:>14.2f}")
+        count *= 10
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
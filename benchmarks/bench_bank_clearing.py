@@ -0,0 +1,61 @@
+"""
+Compare clearing checks with BankAccount.clear_due() and with calling
+clear_check() for each matured check, for a large set of pending checks.
+
+Deposits checks with random clear_after times in one day, then clears
+the day in hourly passes: one account uses clear_due(now) and the other
+calls clear_check() for the checks that are due, found by the caller.
+
+Needs money.py and check.py on the module search path.
+
+Usage: python3 bench_bank_clearing.py [checks]
+"""
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'banking-oracle'))
+from bank_correct import BankAccount
+from check import Check
+
+DAY = 24 * 3600
+
+
+def main(count=1000000, seed=1):
+    rand = random.Random(seed)
+    checks = [(rand.uniform(0, DAY), Check(rand.randint(1, 1000))) for n in range(count)]
+    scheduled = BankAccount("scheduled", 100)
+    by_hand = BankAccount("by hand", 100)
+    start = time.perf_counter()
+    for (clear_after, check) in checks:
+        scheduled.deposit(check, clear_after=clear_after)
+    print(f"deposit {count:,} checks with clear_after  {time.perf_counter() - start:8.3f} sec")
+    for (clear_after, check) in checks:
+        by_hand.deposit(check)
+    gc.collect()
+    elapsed_due = 0.0
+    # the caller of clear_check must find the due checks itself
+    start = time.perf_counter()
+    due = sorted(checks, key=lambda entry: entry[0])
+    elapsed_hand = time.perf_counter() - start
+    position = 0
+    for hour in range(1, 25):
+        now = hour * 3600
+        start = time.perf_counter()
+        cleared = scheduled.clear_due(now)
+        elapsed_due += time.perf_counter() - start
+        start = time.perf_counter()
+        while position < len(due) and due[position][0] <= now:
+            by_hand.clear_check(due[position][1])
+            position += 1
+        elapsed_hand += time.perf_counter() - start
+        assert scheduled.available == by_hand.available
+    print(f"clear_due() in 24 passes               {elapsed_due:8.3f} sec")
+    print(f"sort, then clear_check() each due check {elapsed_hand:7.3f} sec")
+    print(f"{count / elapsed_due:,.0f} checks/sec with clear_due()")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,75 @@
+"""
+Throughput of transfer() between concurrent BankAccounts, as the
+number of threads and the number of accounts they use change.
+
+Each thread makes random transfers between a few "hot" accounts.
+Fewer accounts means more threads wait for the same locks.  After each
+run the benchmark checks that no money was created or lost and that
+no account is below its minimum balance.
+
+Needs money.py and check.py on the module search path.
+
+Usage: python3 bench_bank_contention.py [transfers] [max_threads]
+"""
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'banking-oracle'))
+from bank_correct import BankAccount, transfer
+from money import Money
+
+MIN_BALANCE = 100
+OPENING = 10000
+
+
+def worker(accounts, count, seed, start):
+    """Make count random transfers between accounts."""
+    rand = random.Random(seed)
+    start.wait()
+    for n in range(count):
+        src, dst = rand.sample(accounts, 2)
+        try:
+            transfer(src, dst, rand.randint(1, 500))
+        except ValueError:
+            # not enough available in src
+            pass
+
+
+def run(threads, hot, count):
+    """Run count transfers in total on threads threads, between hot accounts.
+       Returns the elapsed time.
+    """
+    accounts = [BankAccount(f"hot{n}", MIN_BALANCE, concurrent=True) for n in range(hot)]
+    for account in accounts:
+        account.deposit(Money(OPENING))
+    start = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=worker, args=(accounts, count // threads, n, start))
+               for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    begin = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - begin
+    assert sum(account.balance for account in accounts) == hot * OPENING, "money not conserved"
+    assert all(account.balance >= MIN_BALANCE for account in accounts), "overdrawn"
+    return elapsed
+
+
+def main(count=200000, max_threads=8):
+    print(f"{count:,} transfers per run")
+    print(f"{'threads':>8}{'accounts':>10}{'seconds':>10}{'transfers/sec':>16}")
+    threads = 1
+    while threads <= max_threads:
+        for hot in (2, 8, 64):
+            elapsed = run(threads, hot, count)
+            print(f"{threads:>8}{hot:>10}{elapsed:>10.3f}{count / elapsed:>16,.0f}")
+        threads *= 2
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
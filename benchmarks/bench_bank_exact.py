@@ -0,0 +1,84 @@
+"""
+Compare BankAccount with float balances and with exact=True (cents).
+
+Posts the same random stream of deposits, checks, clears and withdraws,
+with amounts in whole cents, to a float account and an exact account,
+and keeps an independent ledger in integer cents.  Reports the time
+for each account and how far each balance drifted from the ledger.
+
+Needs money.py and check.py on the module search path.
+
+Usage: python3 bench_bank_exact.py [transactions]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'banking-oracle'))
+from bank_correct import BankAccount
+from money import Money
+from check import Check
+
+# transactions are made and posted in chunks, to limit memory use
+CHUNK = 100000
+
+
+def make_chunk(rand, pending, count):
+    """Random transactions with amounts in whole cents, and the change
+       in the ledger balance (cents) of each if it is accepted.
+       Checks are cleared a little more often than they are deposited,
+       so few checks are pending at once.
+    """
+    chunk = []
+    for n in range(count):
+        r = rand.random()
+        cents = rand.randint(1, 100000)
+        if r < 0.3:
+            chunk.append(("deposit", Money(cents / 100), cents))
+        elif r < 0.5:
+            check = Check(cents / 100)
+            pending.append(check)
+            chunk.append(("deposit", check, cents))
+        elif r < 0.75 and pending:
+            chunk.append(("clear", pending.pop(rand.randrange(len(pending))), 0))
+        else:
+            chunk.append(("withdraw", cents / 100, -cents))
+    return chunk
+
+
+def post(account, chunk):
+    """Post a chunk to an account. Returns the accepted changes, in cents."""
+    outcomes = account.post_batch((action, argument) for (action, argument, cents) in chunk)
+    return [cents for (outcome, (action, argument, cents)) in zip(outcomes, chunk)
+            if not isinstance(outcome, Exception)]
+
+
+def main(count=10000000, seed=1):
+    rand = random.Random(seed)
+    pending = []
+    accounts = {"float": BankAccount("float", 100), "exact": BankAccount("exact", 100, exact=True)}
+    ledgers = {name: 0 for name in accounts}
+    times = {name: 0.0 for name in accounts}
+    mismatched = {name: 0 for name in accounts}
+    for start in range(0, count, CHUNK):
+        chunk = make_chunk(rand, pending, min(CHUNK, count - start))
+        for (name, account) in accounts.items():
+            begin = time.perf_counter()
+            accepted = post(account, chunk)
+            times[name] += time.perf_counter() - begin
+            ledgers[name] += sum(accepted)
+            if round(account.balance * 100) != ledgers[name]:
+                mismatched[name] += 1
+    print(f"{count:,} transactions")
+    print(f"{'mode':<8}{'seconds':>10}{'balance':>22}{'drift':>14}{'chunks off':>12}")
+    for (name, account) in accounts.items():
+        drift = account.balance - ledgers[name] / 100
+        print(f"{name:<8}{times[name]:>10.2f}{account.balance:>22.2f}{drift:>14.3g}"
+              f"{mismatched[name]:>12}")
+    # the exact account must match its ledger to the cent
+    return 1 if ledgers["exact"] != round(accounts["exact"].balance * 100) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*map(int, sys.argv[1:])))
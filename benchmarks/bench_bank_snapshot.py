@@ -0,0 +1,82 @@
+"""
+Time to rebuild many BankAccounts from an AccountLog: by replaying the
+whole log, and from a snapshot plus the records written after it.
+
+Each account gets a few random deposits, checks, clears and withdraws.
+Recovery from a snapshot memory-maps it and loads an account when it is
+used, so the time to use every account is shown too.
+
+Needs money.py and check.py on the module search path.
+
+Usage: python3 bench_bank_snapshot.py [accounts] [transactions_per_account]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'banking-oracle'))
+from bank_correct import BankAccount
+from account_log import AccountLog, recover
+from money import Money
+from check import Check
+
+
+def transactions(log, accounts, count, rand):
+    """Apply count random transactions to each account, in random order."""
+    pending = {}
+    for n in range(count * len(accounts)):
+        account_id = rand.randrange(len(accounts))
+        account = accounts[account_id]
+        r = rand.random()
+        try:
+            if r < 0.4:
+                account.deposit(Money(rand.randint(1, 1000)))
+            elif r < 0.6:
+                check = Check(rand.randint(1, 1000))
+                account.deposit(check)
+                pending.setdefault(account_id, []).append(check)
+            elif r < 0.8 and pending.get(account_id):
+                account.clear_check(pending[account_id].pop())
+            else:
+                account.withdraw(rand.randint(1, 500))
+        except ValueError:
+            pass
+    log.flush()
+
+
+def timed(label, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    print(f"{label:<36}{time.perf_counter() - start:8.3f} sec")
+    return result
+
+
+def main(count=200000, per_account=5):
+    rand = random.Random(1)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "accounts.log")
+        log = AccountLog(path, fsync="never", batch_size=10000)
+        accounts = timed(f"open {count:,} accounts",
+                         lambda: [BankAccount(f"acct{n}", 100, log=log) for n in range(count)])
+        timed(f"{count * per_account:,} transactions", transactions, log, accounts,
+              per_account, rand)
+        balances = [account.balance for account in accounts]
+        log.close()
+        print(f"log is {os.path.getsize(path) / 2**20:.1f} MB")
+
+        replayed = timed("replay the whole log", recover, path)
+        assert [replayed.account(n).balance for n in range(count)] == balances
+        timed("write snapshot", replayed.snapshot)
+        print(f"snapshot is {os.path.getsize(path + '.snap') / 2**20:.1f} MB")
+        replayed.close()
+
+        restored = timed("recover from snapshot", recover, path)
+        timed("load every account", lambda: [restored.account(n) for n in range(count)])
+        assert [restored.account(n).balance for n in range(count)] == balances
+        restored.close()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
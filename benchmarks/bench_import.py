@@ -0,0 +1,171 @@
+"""
+Cold-start cost of importing each oracle module, measured with
+python -X importtime in a new interpreter for each run.
+
+For each module it shows the median import time (microseconds, including
+everything the module imports), the number of modules it imports that
+a bare interpreter has not already loaded, and its most expensive
+imports.  Bytecode is compiled once, into a temporary cache, before the
+runs, as it is when grading; with --compile each run compiles the
+source again.
+
+Usage:
+    python3 bench_import.py [--runs 15] [-p dir_with_money_and_check] [-o results.json]
+    python3 bench_import.py --baseline old.json [--threshold 0.2] ...
+
+With --baseline, modules more than threshold (default 20%) slower than
+in a saved JSON file are flagged.  The exit status is the number of
+regressions.  The bank modules need money.py and check.py, so they are
+measured only if those are on the -p path or in the current directory.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+ORACLE_DIRS = {
+    "auction": os.path.join(here, "..", "auction-oracle"),
+    "bank": os.path.join(here, "..", "banking-oracle"),
+}
+MODULES = {
+    "auction": ["auction", "journal", "async_auction", "auction_house"],
+    "bank": ["bank_correct", "bank_bugs", "check_index", "account_log"],
+}
+# modules that the bank oracle imports from the student's code
+STUDENT_MODULES = ["money", "check"]
+
+
+def import_times(module, env, python=sys.executable):
+    """Run python -X importtime -c "import module".
+       Returns {name: (self usec, cumulative usec, depth)} for each
+       module imported, in the order they finished importing.  The
+       module itself has depth 0 and the modules it imports depth 1.
+    """
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times[name.strip()] = (int(own), int(cumulative), depth)
+    return times
+
+
+def environment(oracle, paths, compile_each_run, cache):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ORACLE_DIRS[oracle]] + paths)
+    if compile_each_run:
+        env["PYTHONDONTWRITEBYTECODE"] = "1"
+        env.pop("PYTHONPYCACHEPREFIX", None)
+    else:
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        env["PYTHONPYCACHEPREFIX"] = cache
+    return env
+
+
+def measure(module, env, startup, runs):
+    """Median cumulative import time of a module over runs, the number of
+       modules it imports that were not loaded at startup, and the
+       modules it imports directly, with the median cumulative time of
+       each, most expensive first.
+    """
+    totals = []
+    imported = set()
+    direct = {}
+    for n in range(runs):
+        times = import_times(module, env)
+        totals.append(times[module][1])
+        for (name, (own, cumulative, depth)) in times.items():
+            if name != module and name not in startup:
+                imported.add(name)
+                if depth == 1:
+                    direct.setdefault(name, []).append(cumulative)
+    heaviest = sorted(((statistics.median(usec), name) for (name, usec) in direct.items()),
+                      reverse=True)
+    return statistics.median(totals), len(imported), heaviest
+
+
+def available(module, paths):
+    """True if a module can be found on the paths or the current directory."""
+    return any(os.path.exists(os.path.join(folder, module + ".py"))
+               for folder in paths + [os.getcwd()])
+
+
+def run(paths, runs, compile_each_run=False, show=print):
+    results = []
+    with tempfile.TemporaryDirectory() as cache:
+        startup = import_times("sys", environment("auction", paths, compile_each_run, cache))
+        for (oracle, modules) in MODULES.items():
+            if oracle == "bank" and not all(available(m, paths) for m in STUDENT_MODULES):
+                show(f"{oracle:<8}skipped: money.py and check.py not found (use -p)")
+                continue
+            env = environment(oracle, paths, compile_each_run, cache)
+            for module in modules:
+                # compile into the cache, and let the OS cache the files
+                import_times(module, env)
+                usec, count, heaviest = measure(module, env, startup, runs)
+                names = ", ".join(f"{name} {cost:.0f}" for (cost, name) in heaviest[:3])
+                show(f"{oracle:<8}{module:<16}{usec:>10.0f}{count:>9}   {names}")
+                results.append({"oracle": oracle, "module": module, "usec": usec,
+                                "modules": count})
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print modules that import slower than the baseline by more than
+       threshold (a fraction).  Returns the number of regressions.
+    """
+    base = {result["module"]: result["usec"] for result in baseline["results"]}
+    regressions = 0
+    for result in results:
+        old = base.get(result["module"])
+        if not old:
+            continue
+        ratio = result["usec"] / old
+        if ratio > 1 + threshold:
+            regressions += 1
+            print(f"REGRESSION {result['module']}: {old:.0f} -> {result['usec']:.0f} usec "
+                  f"({ratio - 1:+.0%})")
+    print(f"{regressions} regressions in {len(results)} modules (threshold {threshold:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time of the oracle modules.")
+    parser.add_argument("--runs", type=int, default=15,
+                        help="interpreters started for each module (default: 15)")
+    parser.add_argument("-p", "--path", action="append", default=[],
+                        help="directory to search for modules, such as money.py and check.py")
+    parser.add_argument("--compile", action="store_true",
+                        help="compile the source in every run, instead of caching bytecode")
+    parser.add_argument("-o", "--output", help="save results to a JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown that is a regression (default: 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    paths = [os.path.abspath(folder) for folder in args.path]
+    print(f"{'oracle':<8}{'module':<16}{'usec':>10}{'imports':>9}   most expensive imports (usec)")
+    results = run(paths, args.runs, args.compile)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "date": time.strftime("%Y-%m-%d %H:%M:%S"), "runs": args.runs,
+                       "compile": args.compile, "results": results}, file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            return compare(results, json.load(file), args.threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
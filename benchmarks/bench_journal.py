@@ -0,0 +1,64 @@
+"""
+Benchmark for the bid journal: bids per second with each fsync
+policy, and time to recover an auction from its journal.
+
+Usage: python3 bench_journal.py [bids] [bidders]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'auction-oracle'))
+from auction import Auction, profile_for
+from journal import BidJournal, recover
+
+PROFILE = profile_for(1)
+# fsync on every record is slow, so it gets fewer bids
+ALWAYS_BIDS = 2000
+
+
+def journal_bids(path, bids, bidders, **options):
+    """Place bids on a journaled auction. Returns (bids/sec, auction)."""
+    auction = Auction("bench", profile=PROFILE, journal=BidJournal(path, **options))
+    auction.start()
+    names = [f"bidder {n}" for n in range(bidders)]
+    start = time.perf_counter()
+    for n in range(bids):
+        auction.bid(names[n % bidders], n + 1)
+    auction.journal.close()
+    return bids / (time.perf_counter() - start), auction
+
+
+def time_recovery(path, auction):
+    """Return seconds to recover an auction, after checking the result."""
+    start = time.perf_counter()
+    recovered = recover(path, profile=PROFILE)
+    elapsed = time.perf_counter() - start
+    recovered.journal.close()
+    assert recovered.bids == auction.bids
+    assert recovered.winner() == auction.winner()
+    return elapsed
+
+
+def main(bids=1000000, bidders=10000):
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "auction.log")
+        print(f"{'fsync policy':<14}{'bids':>10}{'bids/sec':>14}")
+        for (policy, count) in (("always", ALWAYS_BIDS), ("batch", bids), ("never", bids)):
+            for suffix in ("", ".snap"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            rate, auction = journal_bids(path, count, bidders, fsync=policy,
+                                         snapshot_every=0)
+            print(f"{policy:<14}{count:>10}{rate:>14,.0f}")
+        print(f"recover {bids} bids from journal only:     {time_recovery(path, auction):6.3f} sec")
+        os.remove(path)
+        # snapshot at 90% of the bids, so only the tail is replayed
+        rate, auction = journal_bids(path, bids, bidders, fsync="never",
+                                     snapshot_every=bids * 9 // 10)
+        print(f"recover {bids} bids from snapshot + tail:  {time_recovery(path, auction):6.3f} sec")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,71 @@
+"""
+Cost of metrics.py instrumentation for Auction.bid() and
+BankAccount.deposit()/withdraw(): before instrument(), while
+instrumented, and after uninstrument().  Prints the metrics collected,
+in Prometheus text format.
+
+Needs money.py and check.py on the module search path.
+
+Usage: python3 bench_metrics.py [calls]
+"""
+import os
+import sys
+import time
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'banking-oracle'))
+sys.path.insert(0, os.path.join(here, '..', 'auction-oracle'))
+sys.path.insert(0, os.path.join(here, '..', 'grader'))
+import auction
+import bank_correct
+from metrics import Metrics, instrument, uninstrument
+from money import Money
+
+
+def bids(count):
+    """Time count bids, half of them too low. Returns nanoseconds per bid."""
+    item = auction.Auction("item")
+    item.start()
+    start = time.perf_counter()
+    for n in range(count):
+        try:
+            item.bid("Bidder", n if n % 2 else 1)
+        except auction.AuctionError:
+            pass
+    return 1e9 * (time.perf_counter() - start) / count
+
+
+def transactions(count):
+    """Time count deposits and count withdraws, some of them too large.
+       Returns nanoseconds per transaction.
+    """
+    account = bank_correct.BankAccount("account", 100)
+    money = Money(10)
+    start = time.perf_counter()
+    for n in range(count):
+        account.deposit(money)
+        try:
+            account.withdraw(15)
+        except ValueError:
+            pass
+    return 1e9 * (time.perf_counter() - start) / (2 * count)
+
+
+def main(count=200000):
+    metrics = Metrics()
+    timings = {"before": (bids(count), transactions(count))}
+    instrument(auction.Auction, ["bid", "accept_bid"], metrics)
+    instrument(bank_correct.BankAccount, ["deposit", "withdraw", "available"], metrics)
+    timings["instrumented"] = (bids(count), transactions(count))
+    uninstrument(auction.Auction)
+    uninstrument(bank_correct.BankAccount)
+    timings["after"] = (bids(count), transactions(count))
+    print(metrics.prometheus(), end="")
+    print("")
+    print(f"{'':<14}{'ns/bid':>10}{'ns/transaction':>16}")
+    for (label, (bid, transaction)) in timings.items():
+        print(f"{label:<14}{bid:>10.0f}{transaction:>16.0f}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
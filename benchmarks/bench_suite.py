@@ -0,0 +1,285 @@
+"""
+Benchmark suite for the hot paths of Auction and BankAccount, run on
+every TESTCASE variant of each oracle.
+
+Cases (each for each size):
+  auction  bid_unique   size bids, each by a new bidder
+           bid_repeat   size bids by 10 bidders
+           query_mix    an auction with size bidders; 10 * size calls,
+                        90% best_bid()/winner() and 10% bid()
+  bank     deposit      deposit size checks
+           clear        clear size pending checks, in random order
+           withdraw     10,000 withdraws with size checks pending
+           available    10,000 reads of available with size checks pending
+
+Each case is run --repeat times with new objects and the fastest time
+is kept, as nanoseconds per operation.  Random choices use a fixed
+seed, so runs are repeatable.
+
+Usage:
+    python3 bench_suite.py [--oracle auction|bank|all] [--sizes 100,10000]
+                           [--variants 1,8] [--repeat 5] [-o results.json]
+    python3 bench_suite.py --baseline old.json [--threshold 0.1] ...
+
+With --baseline, each result is compared with the same result in a
+saved JSON file, and results more than threshold (default 10%) slower
+are flagged.  The exit status is the number of regressions.
+
+The bank cases need money.py and check.py on the module search path.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'banking-oracle'))
+sys.path.insert(0, os.path.join(here, '..', 'auction-oracle'))
+
+VARIANTS = {"auction": range(1, 9), "bank": range(1, 10)}
+# the bank variant that is bank_correct.py
+BANK_CORRECT = 8
+
+# a rejected bid or transaction may raise any exception, depending on the variant
+REJECTED = Exception
+
+CASES = {"auction": {}, "bank": {}}
+
+
+def case(oracle):
+    """Register a benchmark case.  The case is a function of (variant, size)
+       that creates the objects for one run and returns a function that
+       does the run and returns the number of operations.
+    """
+    def register(function):
+        CASES[oracle][function.__name__] = function
+        return function
+    return register
+
+
+def new_auction(variant):
+    import auction
+    auction.Auction.set_testcase(variant)
+    item = auction.Auction("Benchmark")
+    item.start()
+    return item
+
+
+def place_bids(item, names):
+    """Bid 1, 2, 3, ... by names in turn, ignoring rejected bids."""
+    for (amount, name) in enumerate(names, 1):
+        try:
+            item.bid(name, amount)
+        except REJECTED:
+            pass
+
+
+@case("auction")
+def bid_unique(variant, size):
+    item = new_auction(variant)
+    names = [f"Bidder {n}" for n in range(size)]
+    return lambda: place_bids(item, names) or size
+
+
+@case("auction")
+def bid_repeat(variant, size):
+    item = new_auction(variant)
+    names = [f"Bidder {n % 10}" for n in range(size)]
+    return lambda: place_bids(item, names) or size
+
+
+@case("auction")
+def query_mix(variant, size):
+    item = new_auction(variant)
+    place_bids(item, [f"Bidder {n}" for n in range(size)])
+    rand = random.Random(size)
+    choices = [rand.random() for n in range(10 * size)]
+
+    def run():
+        amount = size
+        for r in choices:
+            if r < 0.45:
+                item.best_bid()
+            elif r < 0.9:
+                item.winner()
+            else:
+                amount += 1
+                try:
+                    item.bid("Late Bidder", amount)
+                except REJECTED:
+                    pass
+        return len(choices)
+    return run
+
+
+def new_account(variant):
+    os.environ['TESTCASE'] = str(variant)
+    if variant == BANK_CORRECT:
+        import bank_correct as bank_account
+    else:
+        import bank_bugs as bank_account
+    return bank_account.BankAccount("Benchmark", 100)
+
+
+def deposit_checks(account, checks):
+    for check in checks:
+        try:
+            account.deposit(check)
+        except REJECTED:
+            pass
+
+
+@case("bank")
+def deposit(variant, size):
+    from check import Check
+    account = new_account(variant)
+    checks = [Check(n % 1000 + 1) for n in range(size)]
+    return lambda: deposit_checks(account, checks) or size
+
+
+@case("bank")
+def clear(variant, size):
+    from check import Check
+    account = new_account(variant)
+    checks = [Check(n % 1000 + 1) for n in range(size)]
+    deposit_checks(account, checks)
+    random.Random(size).shuffle(checks)
+
+    def run():
+        for check in checks:
+            try:
+                account.clear_check(check)
+            except REJECTED:
+                pass
+        return len(checks)
+    return run
+
+
+def account_with_holds(variant, size):
+    """An account with cash and size pending checks."""
+    from check import Check
+    from money import Money
+    account = new_account(variant)
+    account.deposit(Money(1000000))
+    deposit_checks(account, [Check(n % 1000 + 1) for n in range(size)])
+    return account
+
+
+@case("bank")
+def withdraw(variant, size):
+    account = account_with_holds(variant, size)
+    # one withdraw in 10 is too large
+    amounts = [10 if n % 10 else 10**9 for n in range(10000)]
+
+    def run():
+        for amount in amounts:
+            try:
+                account.withdraw(amount)
+            except REJECTED:
+                pass
+        return len(amounts)
+    return run
+
+
+@case("bank")
+def available(variant, size):
+    account = account_with_holds(variant, size)
+
+    def run():
+        for n in range(10000):
+            account.available
+        return 10000
+    return run
+
+
+def measure(function, variant, size, repeat):
+    """Fastest time of repeat runs, in nanoseconds per operation."""
+    best = None
+    for n in range(repeat):
+        run = function(variant, size)
+        gc.collect()
+        start = time.perf_counter()
+        operations = run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed / operations < best:
+            best = elapsed / operations
+    return 1e9 * best
+
+
+def run_suite(oracles, sizes, variants=None, repeat=5, show=print):
+    """Run the cases. Returns a list of result dicts."""
+    results = []
+    for oracle in oracles:
+        for (name, function) in CASES[oracle].items():
+            for size in sizes:
+                for variant in VARIANTS[oracle]:
+                    if variants and variant not in variants:
+                        continue
+                    ns = measure(function, variant, size, repeat)
+                    result = {"oracle": oracle, "case": name, "size": size,
+                              "variant": variant, "ns_per_op": round(ns, 1)}
+                    results.append(result)
+                    show(f"{oracle:<8}{name:<12}{size:>8}{variant:>8}{ns:>12.0f}")
+    return results
+
+
+def key(result):
+    return (result["oracle"], result["case"], result["size"], result["variant"])
+
+
+def compare(results, baseline, threshold):
+    """Print results that are slower than the baseline by more than
+       threshold (a fraction).  Returns the number of regressions.
+    """
+    base = {key(result): result["ns_per_op"] for result in baseline["results"]}
+    regressions = 0
+    for result in results:
+        old = base.get(key(result))
+        if not old:
+            continue
+        ratio = result["ns_per_op"] / old
+        if ratio > 1 + threshold:
+            regressions += 1
+            oracle, name, size, variant = key(result)
+            print(f"REGRESSION {oracle} {name} size={size} variant={variant}: "
+                  f"{old:.0f} -> {result['ns_per_op']:.0f} ns/op ({ratio - 1:+.0%})")
+    print(f"{regressions} regressions in {len(results)} results "
+          f"(threshold {threshold:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Auction and BankAccount.")
+    parser.add_argument("--oracle", choices=["auction", "bank", "all"], default="all")
+    parser.add_argument("--sizes", default="100,10000",
+                        help="comma separated sizes (default: 100,10000)")
+    parser.add_argument("--variants", help="comma separated TESTCASE variants (default: all)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of each case; the fastest is kept (default: 5)")
+    parser.add_argument("-o", "--output", help="save results to a JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown that is a regression (default: 0.1 = 10%%)")
+    args = parser.parse_args(argv)
+    oracles = ["auction", "bank"] if args.oracle == "all" else [args.oracle]
+    sizes = [int(size) for size in args.sizes.split(",")]
+    variants = [int(v) for v in args.variants.split(",")] if args.variants else None
+    print(f"{'oracle':<8}{'case':<12}{'size':>8}{'variant':>8}{'ns/op':>12}")
+    results = run_suite(oracles, sizes, variants, args.repeat)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "date": time.strftime("%Y-%m-%d %H:%M:%S"), "repeat": args.repeat,
+                       "results": results}, file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            return compare(results, json.load(file), args.threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,521 @@
+"""
+Differential fuzzer for the oracle variants.  It generates random
+sequences of operations, runs each sequence against the correct code
+and every TESTCASE variant in the same process, and reports which
+variants the sequences tell apart from the correct code.
+
+A sequence tells a variant apart when any operation has a different
+outcome (what it returned, or the type of exception it raised) or
+leaves a different observable state:
+  auction  is_active(), best_bid() and winner()
+  bank     balance and available
+
+For each variant that some sequence detects, the first such sequence
+is shrunk to a minimal reproducer: operations are removed and amounts
+simplified while the variant still differs from the correct code.
+
+Sequences are generated and run in batches by worker processes, one
+batch per task, so only the counts and the first detecting sequence of
+each variant are sent back.  Sequences come from a seeded random
+generator, so a run with the same options finds the same sequences.
+
+Usage:
+    python3 fuzz.py auction [-n sequences] [-l length] [-s seed] [-j jobs]
+    python3 fuzz.py bank [-n sequences] ... [-p dir_with_money_and_check]
+
+The exit status is the number of buggy variants that no sequence
+detected.
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ORACLE_DIRS = {
+    "auction": os.path.join(HERE, "..", "auction-oracle"),
+    "bank": os.path.join(HERE, "..", "banking-oracle"),
+}
+LINE = "-" * 70
+
+# variants of each oracle, and the variant that is correct
+VARIANTS = {"auction": range(1, 9), "bank": range(1, 10)}
+CORRECT = {"auction": 1, "bank": 8}
+
+# names a bidder may use, including ones that normalize to the same name
+# and one that is blank after normalizing
+BIDDERS = ("Ann", "ann ", " BOB", "Bob", "Cat Dog", " cat  dog ", "   ")
+
+
+def random_amount(rand, near):
+    """A bid or transaction amount: usually an int near another amount,
+       sometimes a float, zero or negative.
+    """
+    r = rand.random()
+    if r < 0.05:
+        return 0
+    if r < 0.1:
+        return -rand.randint(1, 100)
+    amount = max(1, near + rand.randint(-3, 5))
+    if r < 0.3:
+        return amount + rand.choice((0.5, 0.25, -0.5))
+    return amount
+
+
+def auction_sequence(rand, length):
+    """A random auction: (min increment, operations)."""
+    increment = rand.choice((1, 1, 1, 2, 0.5))
+    ops = []
+    best = 0
+    for n in range(length):
+        r = rand.random()
+        if r < 0.1:
+            ops.append(("start",))
+        elif r < 0.15:
+            ops.append(("stop",))
+        else:
+            amount = random_amount(rand, best + increment)
+            best = max(best, amount)
+            ops.append(("bid", rand.choice(BIDDERS), amount))
+    if rand.random() < 0.8:
+        # most auctions start before the first bid
+        ops.insert(0, ("start",))
+    return (increment, tuple(ops))
+
+
+def bank_sequence(rand, length):
+    """A random bank account: (min balance, values of the checks, operations).
+       Checks are numbered by their position in the values; a check is
+       only created when it is used, so an unused check costs nothing.
+    """
+    min_balance = rand.choice((0, 0, 100, 250))
+    values = []
+    ops = []
+    balance = 0
+    for n in range(length):
+        r = rand.random()
+        if r < 0.25:
+            amount = random_amount(rand, rand.choice((50, 100, 300)))
+            balance += max(amount, 0)
+            ops.append(("cash", amount))
+        elif r < 0.45:
+            if values and rand.random() < 0.15:
+                # deposit a check again
+                ops.append(("deposit", rand.randrange(len(values))))
+            else:
+                values.append(random_amount(rand, rand.choice((20, 100, 200))))
+                ops.append(("deposit", len(values) - 1))
+        elif r < 0.65 and values:
+            ops.append(("clear", rand.randrange(len(values))))
+        else:
+            ops.append(("withdraw", random_amount(rand, rand.randint(0, max(int(balance), 1)))))
+    return (min_balance, tuple(values), tuple(ops))
+
+
+def outcome(function, *args):
+    """What a call returned, or the name of the exception it raised."""
+    try:
+        return ("returned", value_of(function(*args)))
+    except Exception as ex:
+        return ("raised", type(ex).__name__)
+
+
+def value_of(result):
+    """A result that can be compared: the value of Money, else the result."""
+    return getattr(result, "value", result)
+
+
+class AuctionRunner:
+    """Runs auction sequences against one variant."""
+
+    def __init__(self, variant):
+        import auction
+        self.Auction = auction.Auction
+        self.profile = auction.profile_for(variant)
+
+    def run(self, sequence, limit=None):
+        """Run a sequence, stopping early when an observation differs
+           from limit (the observations of the correct variant).
+           Returns the list of observations: the initial state, then
+           (outcome, state) after each operation.
+        """
+        increment, ops = sequence
+        item = self.Auction("Fuzz", increment, profile=self.profile)
+        observed = [self.state(item)]
+        if limit is not None and observed[0] != limit[0]:
+            return observed
+        for (n, op) in enumerate(ops, 1):
+            kind = op[0]
+            if kind == "bid":
+                result = outcome(item.bid, op[1], op[2])
+            elif kind == "start":
+                result = outcome(item.start)
+            else:
+                result = outcome(item.stop)
+            observed.append((result, self.state(item)))
+            if limit is not None and observed[n] != limit[n]:
+                break
+        return observed
+
+    @staticmethod
+    def state(item):
+        return (item.is_active(), item.best_bid(), item.winner())
+
+
+class BankRunner:
+    """Runs bank account sequences against one variant."""
+
+    def __init__(self, variant):
+        from money import Money
+        from check import Check
+        self.Money = Money
+        self.Check = Check
+        if variant == CORRECT["bank"]:
+            import bank_correct
+            self.BankAccount = bank_correct.BankAccount
+            self.bug = None
+        else:
+            import bank_bugs
+            self.BankAccount = bank_bugs.BankAccount
+            self.bug = variant
+
+    def run(self, sequence, limit=None):
+        """Like AuctionRunner.run() for a bank account."""
+        min_balance, values, ops = sequence
+        account = self.BankAccount("Fuzz", min_balance)
+        if self.bug is not None:
+            account.bug = self.bug
+        checks = {}
+        observed = [self.state(account)]
+        if limit is not None and observed[0] != limit[0]:
+            return observed
+        for (n, op) in enumerate(ops, 1):
+            kind = op[0]
+            if kind == "cash":
+                result = outcome(self.deposit_cash, account, op[1])
+            elif kind == "withdraw":
+                result = outcome(account.withdraw, op[1])
+            else:
+                check = checks.get(op[1])
+                if check is None:
+                    try:
+                        check = checks[op[1]] = self.Check(values[op[1]])
+                    except Exception as ex:
+                        check = checks[op[1]] = ("raised", type(ex).__name__)
+                if type(check) is tuple:
+                    # Check() raised an exception
+                    result = check
+                elif kind == "deposit":
+                    result = outcome(account.deposit, check)
+                else:
+                    result = outcome(account.clear_check, check)
+            observed.append((result, self.state(account)))
+            if limit is not None and observed[n] != limit[n]:
+                break
+        return observed
+
+    def deposit_cash(self, account, amount):
+        account.deposit(self.Money(amount))
+
+    @staticmethod
+    def state(account):
+        return (account.balance, account.available)
+
+
+RUNNERS = {"auction": AuctionRunner, "bank": BankRunner}
+GENERATORS = {"auction": auction_sequence, "bank": bank_sequence}
+
+
+def first_difference(expected, observed):
+    """Index of the first observation that differs, or None if none do."""
+    for (n, (want, got)) in enumerate(zip(expected, observed)):
+        if want != got:
+            return n
+    return None if len(expected) == len(observed) else min(len(expected), len(observed))
+
+
+class Fuzzer:
+    """The runners for the correct code and each buggy variant of an oracle."""
+
+    def __init__(self, oracle, paths=()):
+        for folder in list(paths) + [ORACLE_DIRS[oracle]]:
+            if folder not in sys.path:
+                sys.path.insert(0, folder)
+        self.oracle = oracle
+        runner = RUNNERS[oracle]
+        self.correct = runner(CORRECT[oracle])
+        self.variants = {variant: runner(variant) for variant in VARIANTS[oracle]
+                         if variant != CORRECT[oracle]}
+
+    def differs(self, variant, sequence):
+        """Index of the first observation where a variant differs from
+           the correct code for a sequence, or None.
+        """
+        expected = self.correct.run(sequence)
+        return first_difference(expected, self.variants[variant].run(sequence, expected))
+
+    def run_batch(self, seed, batch, count, length):
+        """Generate and run count sequences.
+           Returns (count, {variant: [sequences detecting it, first such sequence]}).
+        """
+        rand = random.Random(seed * 1000003 + batch)
+        generate = GENERATORS[self.oracle]
+        detected = {}
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for n in range(count):
+                sequence = generate(rand, rand.randint(1, length))
+                expected = self.correct.run(sequence)
+                for (variant, runner) in self.variants.items():
+                    if first_difference(expected, runner.run(sequence, expected)) is not None:
+                        if variant in detected:
+                            detected[variant][0] += 1
+                        else:
+                            detected[variant] = [1, sequence]
+        return (count, detected)
+
+    def shrink(self, variant, sequence):
+        """A smallest sequence that still tells variant apart, found by
+           removing operations and then simplifying amounts.
+        """
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            while True:
+                smaller = self.simplify(variant, self.remove_ops(variant, sequence))
+                if smaller == sequence:
+                    return renumber_checks(sequence)
+                sequence = smaller
+
+    def remove_ops(self, variant, sequence):
+        """Remove chunks of operations, halving the chunk size, while the
+           sequence still tells variant apart.
+        """
+        n = self.differs(variant, sequence)
+        # operations after the first difference are never needed
+        sequence = with_ops(sequence, ops_of(sequence)[:n])
+        chunk = max(len(ops_of(sequence)) // 2, 1)
+        while True:
+            start = 0
+            while start < len(ops_of(sequence)):
+                ops = ops_of(sequence)
+                smaller = with_ops(sequence, ops[:start] + ops[start + chunk:])
+                if self.differs(variant, smaller) is not None:
+                    sequence = smaller
+                else:
+                    start += chunk
+            if chunk == 1:
+                return sequence
+            chunk //= 2
+
+    def simplify(self, variant, sequence):
+        """Replace amounts and names with simpler ones, where the sequence
+           still tells variant apart.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for simpler in simpler_sequences(sequence):
+                if self.differs(variant, simpler) is not None:
+                    sequence = simpler
+                    changed = True
+                    break
+        return sequence
+
+    def explain(self, variant, sequence):
+        """Lines of code for a sequence, and what the correct code and
+           the variant did at the first difference.
+        """
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            expected = self.correct.run(sequence)
+            observed = self.variants[variant].run(sequence)
+        n = first_difference(expected, observed)
+        lines = code_lines(self.oracle, sequence)
+        lines.append(f"# correct:     {describe(expected[n])}")
+        lines.append(f"# variant {variant:<3} {describe(observed[n])}")
+        return lines
+
+
+def ops_of(sequence):
+    return sequence[-1]
+
+
+def with_ops(sequence, ops):
+    return sequence[:-1] + (tuple(ops),)
+
+
+def renumber_checks(sequence):
+    """A bank sequence with only the checks it uses, numbered from 0 in
+       the order they are first used.  An auction sequence is unchanged.
+    """
+    if len(sequence) == 2:
+        return sequence
+    min_balance, values, ops = sequence
+    numbers = {}
+    for op in ops:
+        if op[0] in ("deposit", "clear"):
+            numbers.setdefault(op[1], len(numbers))
+    ops = tuple((op[0], numbers[op[1]]) if op[0] in ("deposit", "clear") else op for op in ops)
+    return (min_balance, tuple(values[k] for k in numbers), ops)
+
+
+def simpler_amounts(amount):
+    """Simpler amounts to try in place of an amount, simplest first."""
+    if amount <= 0:
+        return [0] if amount else []
+    whole = int(amount)
+    candidates = [1, whole // 2, whole - 1, whole]
+    return [a for a in dict.fromkeys(candidates) if 0 < a < amount]
+
+
+def simpler_sequences(sequence):
+    """Sequences that are each one step simpler than a sequence."""
+    if len(sequence) == 2:
+        # auction
+        increment, ops = sequence
+        if increment != 1:
+            yield (1, ops)
+        for (n, op) in enumerate(ops):
+            if op[0] != "bid":
+                continue
+            for name in BIDDERS[:BIDDERS.index(op[1])]:
+                yield (increment, ops[:n] + (("bid", name, op[2]),) + ops[n + 1:])
+            for amount in simpler_amounts(op[2]):
+                yield (increment, ops[:n] + (("bid", op[1], amount),) + ops[n + 1:])
+        return
+    min_balance, values, ops = sequence
+    if min_balance:
+        yield (0, values, ops)
+    for (k, value) in enumerate(values):
+        for amount in simpler_amounts(value):
+            yield (min_balance, values[:k] + (amount,) + values[k + 1:], ops)
+    for (n, op) in enumerate(ops):
+        if op[0] in ("cash", "withdraw"):
+            for amount in simpler_amounts(op[1]):
+                yield (min_balance, values, ops[:n] + ((op[0], amount),) + ops[n + 1:])
+
+
+def code_lines(oracle, sequence):
+    """A sequence as Python statements."""
+    if oracle == "auction":
+        increment, ops = sequence
+        lines = [f"auction = Auction('Fuzz', min_increment={increment!r})"]
+        for op in ops:
+            args = ", ".join(repr(arg) for arg in op[1:])
+            lines.append(f"auction.{op[0]}({args})")
+        return lines
+    min_balance, values, ops = sequence
+    lines = [f"account = BankAccount('Fuzz', {min_balance!r})"]
+    used = sorted({op[1] for op in ops if op[0] in ("deposit", "clear")})
+    for k in used:
+        lines.append(f"check{k} = Check({values[k]!r})")
+    for op in ops:
+        if op[0] == "cash":
+            lines.append(f"account.deposit(Money({op[1]!r}))")
+        elif op[0] == "withdraw":
+            lines.append(f"account.withdraw({op[1]!r})")
+        elif op[0] == "deposit":
+            lines.append(f"account.deposit(check{op[1]})")
+        else:
+            lines.append(f"account.clear_check(check{op[1]})")
+    return lines
+
+
+def describe(observation):
+    """An observation as text."""
+    if len(observation) == 2 and isinstance(observation[0], tuple):
+        (how, what), state = observation
+        return f"{how} {what!r}, then state {state!r}"
+    return f"initial state {observation!r}"
+
+
+# the Fuzzer of a worker process, made by init_worker()
+worker = None
+
+
+def init_worker(oracle, paths):
+    global worker
+    worker = Fuzzer(oracle, paths)
+
+
+def work(args):
+    return worker.run_batch(*args)
+
+
+def fuzz(oracle, sequences, length=20, seed=0, batch_size=500, jobs=None, paths=()):
+    """Run sequences in batches across worker processes.
+       Returns (sequences run, {variant: [sequences detecting it, first such sequence]}).
+       The first sequence of a variant is from the lowest numbered batch
+       that detected it, so it does not depend on the number of jobs.
+    """
+    batches = [(seed, batch, min(batch_size, sequences - start), length)
+               for (batch, start) in enumerate(range(0, sequences, batch_size))]
+    total = 0
+    detected = {}
+    with multiprocessing.Pool(jobs, initializer=init_worker,
+                              initargs=(oracle, list(paths))) as pool:
+        # imap returns results in batch order
+        for (count, found) in pool.imap(work, batches):
+            total += count
+            for (variant, (hits, sequence)) in found.items():
+                if variant in detected:
+                    detected[variant][0] += hits
+                else:
+                    detected[variant] = [hits, sequence]
+    return (total, detected)
+
+
+def report(fuzzer, total, detected, elapsed, shrink=True):
+    """Print which variants were detected, with a minimal reproducer for
+       each.  Returns the number of variants that were not detected.
+    """
+    print(LINE)
+    print(f"{total:,} {fuzzer.oracle} sequences in {elapsed:.1f} sec "
+          f"({60 * total / elapsed:,.0f} per minute)")
+    print(LINE)
+    print("Variant  Detected by     Fraction")
+    missed = 0
+    for variant in fuzzer.variants:
+        hits = detected.get(variant, [0])[0]
+        if not hits:
+            missed += 1
+        print(f"{variant:5d}    {hits:11,d}  {hits / max(total, 1):10.3%}")
+    if shrink:
+        for (variant, (hits, sequence)) in sorted(detected.items()):
+            smallest = fuzzer.shrink(variant, sequence)
+            print("")
+            count = len(ops_of(smallest))
+            print(f"Variant {variant}: {count} operation{'' if count == 1 else 's'}")
+            for line in fuzzer.explain(variant, smallest):
+                print("    " + line)
+    print(f"{len(fuzzer.variants) - missed} Detected  {missed} Not detected")
+    return missed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find sequences that tell oracle variants apart.")
+    parser.add_argument("oracle", choices=sorted(VARIANTS))
+    parser.add_argument("-n", "--sequences", type=int, default=100000,
+                        help="number of sequences to run (default: 100000)")
+    parser.add_argument("-l", "--length", type=int, default=20,
+                        help="maximum operations in a sequence (default: 20)")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-b", "--batch-size", type=int, default=500,
+                        help="sequences in each task sent to a worker (default: 500)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("-p", "--path", action="append", default=[],
+                        help="directory to search for modules, such as money.py and check.py")
+    parser.add_argument("--no-shrink", action="store_true",
+                        help="do not shrink and show reproducers")
+    args = parser.parse_args(argv)
+    paths = [os.path.abspath(folder) for folder in args.path + ["."]]
+    start = time.perf_counter()
+    total, detected = fuzz(args.oracle, args.sequences, args.length, args.seed,
+                           args.batch_size, args.jobs, paths)
+    elapsed = time.perf_counter() - start
+    return report(Fuzzer(args.oracle, paths), total, detected, elapsed, not args.no_shrink)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
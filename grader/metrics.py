@@ -0,0 +1,214 @@
+"""
+Opt-in metrics for the methods of a class: how many times each method
+is called, a histogram of its latency, how many calls were rejected
+for each reason, and gauges such as the number of bids in auctions.
+
+Nothing is measured until instrument() replaces methods of a class with
+wrappers that time them.  uninstrument() puts the original methods back,
+so a class that is not instrumented runs its own code at full speed.
+
+The oracle classes (Auction, BankAccount) count their own rejections
+where they decide to reject, including the rejections that a defective
+variant makes without raising an exception.  They call their on_reject
+hook, which instrument() sets, with the method and the reason.  They
+also declare metric_gauges, functions of one instance, and instrument()
+adds a gauge for each: the total over the instances made while the
+class is instrumented.
+
+Example:
+    metrics = Metrics()
+    instrument(Auction, ["bid", "accept_bid"], metrics)
+    auction = Auction("Python Cookbook")
+    ...
+    print(metrics.prometheus())
+    uninstrument(Auction)
+"""
+import functools
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+# upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+           1e-3, 1e-2, 0.1, 1.0)
+
+
+class Metrics:
+    """Counts, latency histograms, rejections and gauges of methods."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # by method name: number of calls, total seconds, calls in each
+        # bucket (the last is for calls longer than all the buckets)
+        self.calls = {}
+        self.seconds = {}
+        self.histograms = {}
+        # by (method name, reason): number of rejected calls
+        self.rejections = {}
+        # by gauge name: function that returns the current value
+        self.gauges = {}
+
+    def observe(self, method, seconds):
+        """Record a call of a method that took some seconds."""
+        with self.lock:
+            if method not in self.calls:
+                self.calls[method] = 0
+                self.seconds[method] = 0.0
+                self.histograms[method] = [0] * (len(self.buckets) + 1)
+            self.calls[method] += 1
+            self.seconds[method] += seconds
+            self.histograms[method][bisect_left(self.buckets, seconds)] += 1
+
+    def reject(self, method, reason):
+        """Record a call of a method that was rejected."""
+        with self.lock:
+            key = (method, reason)
+            self.rejections[key] = self.rejections.get(key, 0) + 1
+
+    def gauge(self, name, function):
+        """Add a gauge whose value is function(), read when metrics are exported."""
+        self.gauges[name] = function
+
+    def reset(self):
+        """Forget all counts and histograms (but not gauges)."""
+        with self.lock:
+            self.calls.clear()
+            self.seconds.clear()
+            self.histograms.clear()
+            self.rejections.clear()
+
+    def snapshot(self):
+        """The current metrics, as a dict of plain values."""
+        with self.lock:
+            latency = {}
+            for (method, histogram) in self.histograms.items():
+                cumulative = 0
+                buckets = {}
+                for (bound, count) in zip(self.buckets + (float('inf'),), histogram):
+                    cumulative += count
+                    buckets[bound] = cumulative
+                latency[method] = {"count": self.calls[method], "sum": self.seconds[method],
+                                   "buckets": buckets}
+            rejections = {}
+            for ((method, reason), count) in self.rejections.items():
+                rejections.setdefault(method, {})[reason] = count
+            calls = dict(self.calls)
+        gauges = {name: function() for (name, function) in self.gauges.items()}
+        return {"calls": calls, "rejections": rejections, "latency": latency,
+                "gauges": gauges}
+
+    def prometheus(self, prefix="oracle"):
+        """The current metrics in Prometheus text exposition format."""
+        state = self.snapshot()
+        lines = [f"# HELP {prefix}_calls_total Calls of each method.",
+                 f"# TYPE {prefix}_calls_total counter"]
+        for (method, count) in state["calls"].items():
+            lines.append(f'{prefix}_calls_total{{method="{method}"}} {count}')
+        lines += [f"# HELP {prefix}_rejections_total Calls that were rejected, by reason.",
+                  f"# TYPE {prefix}_rejections_total counter"]
+        for (method, reasons) in state["rejections"].items():
+            for (reason, count) in reasons.items():
+                lines.append(f'{prefix}_rejections_total{{method="{method}",reason="{reason}"}} '
+                             f'{count}')
+        lines += [f"# HELP {prefix}_latency_seconds Time to run each method.",
+                  f"# TYPE {prefix}_latency_seconds histogram"]
+        for (method, latency) in state["latency"].items():
+            for (bound, count) in latency["buckets"].items():
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f'{prefix}_latency_seconds_bucket{{method="{method}",le="{le}"}} '
+                             f'{count}')
+            lines.append(f'{prefix}_latency_seconds_sum{{method="{method}"}} {latency["sum"]!r}')
+            lines.append(f'{prefix}_latency_seconds_count{{method="{method}"}} {latency["count"]}')
+        for (name, value) in state["gauges"].items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def measured(function, name, metrics):
+    """A function that calls function and records its metrics as name."""
+    observe = metrics.observe
+    clock = time.perf_counter
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            observe(name, clock() - start)
+    wrapper.metrics = metrics
+    return wrapper
+
+
+def tracked(init, instances, metrics):
+    """An __init__ that calls init and adds the new object to instances."""
+    @functools.wraps(init)
+    def wrapper(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        with metrics.lock:
+            instances.add(self)
+    wrapper.metrics = metrics
+    return wrapper
+
+
+def total(function, instances, metrics):
+    """A gauge that is the sum of function(instance) over instances."""
+    def gauge():
+        with metrics.lock:
+            objects = list(instances)
+        return sum(function(instance) for instance in objects)
+    return gauge
+
+
+def instrument(cls, names, metrics):
+    """Measure methods and properties of a class, count its rejections,
+       and add its gauges.
+
+       cls: the class
+       names: names of methods or properties of cls to measure.
+              A method that is already measured is measured only by
+              the new metrics.
+       metrics: the Metrics to record them in
+    """
+    for name in names:
+        attr = original(cls.__dict__[name])
+        label = f"{cls.__name__}.{name}"
+        if isinstance(attr, property):
+            attr = property(measured(attr.fget, label, metrics),
+                            attr.fset, attr.fdel, attr.__doc__)
+        else:
+            attr = measured(attr, label, metrics)
+        setattr(cls, name, attr)
+    reject = metrics.reject
+    cls.on_reject = staticmethod(lambda method, reason:
+                                 reject(f"{cls.__name__}.{method}", reason))
+    gauges = getattr(cls, "metric_gauges", {})
+    if gauges:
+        instances = weakref.WeakSet()
+        cls.__init__ = tracked(original(cls.__dict__["__init__"]), instances, metrics)
+        for (name, function) in gauges.items():
+            metrics.gauge(name, total(function, instances, metrics))
+
+
+def original(attr):
+    """The method or property that attr measures, or attr if it is not measured."""
+    function = attr.fget if isinstance(attr, property) else attr
+    if not hasattr(function, "metrics"):
+        return attr
+    if isinstance(attr, property):
+        return property(function.__wrapped__, attr.fset, attr.fdel, attr.__doc__)
+    return function.__wrapped__
+
+
+def uninstrument(cls):
+    """Put back the original methods and properties of a class, and stop
+       counting its rejections.
+    """
+    for (name, attr) in list(cls.__dict__.items()):
+        unmeasured = original(attr)
+        if unmeasured is not attr:
+            setattr(cls, name, unmeasured)
+    cls.on_reject = None
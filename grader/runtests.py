@@ -0,0 +1,540 @@
+"""
+Run a student's unit tests against every TESTCASE variant of an oracle,
+in parallel, and show which variants the tests pass or fail.
+
+This does the same as runtests.sh in auction-oracle and banking-oracle,
+but each variant runs in its own worker process and selects its code in
+memory, so bank_account.py is never overwritten and all variants can
+run at the same time.
+
+Usage (in the directory with the oracle code and the student's tests):
+    python3 runtests.py auction [-t auction_test.py] [-j jobs]
+    python3 runtests.py bank [-t test_bank_account.py] [-j jobs]
+
+Options --warm and --timings:
+    --warm     import the oracle, unittest and the tests once, then run
+               each variant in a fork of that warm interpreter instead
+               of starting a new Python for each variant (POSIX only)
+    --timings  show the startup and run time of each variant, and how
+               long it waited for a free worker (not part of startup)
+
+Results are cached in .oracle-cache (or --cache-dir), keyed by a hash
+of the contents of the files each variant depends on: the tests and
+other Python files in the test and oracle directories, and the oracle
+code of the variant (auction.py; bank_correct.py for bank variant 8 and
+bank_bugs.py for the others).  A variant runs again only when one of
+its files changed, so changing bank_correct.py reruns only variant 8.
+The least recently used results are removed when the cache has more
+than --cache-size of them, and results older than 30 days are removed.
+    --no-cache     run every variant and do not save the results
+    --clear-cache  remove all cached results, then exit
+
+The exit status is the number of variants where the result was not
+the expected result, like showresults() in banking-oracle/runtests.sh.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import hashlib
+import importlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+import unittest
+
+LINE = "-" * 70
+
+# default directory and size of the result cache, and how many days a
+# result is kept.  Change CACHE_VERSION when the cached results change.
+CACHE_DIR = ".oracle-cache"
+CACHE_SIZE = 2000
+CACHE_DAYS = 30
+CACHE_VERSION = 1
+
+AUCTION_MESSAGES = {
+    1: "AUCTION CODE 1: All methods work according to specification. Your tests should PASS.",
+    3: "AUCTION CODE 3: The auction is not rejecting some invalid bids.",
+    4: "AUCTION CODE 4: The auction is not enforcing state correctly.",
+    5: "AUCTION CODE 5: A problem is silently ignored. It should raise an exception.",
+    6: "AUCTION CODE 6: The auction is not setting its state correctly.",
+    8: "AUCTION CODE 8: Two errors in Auction. Do your tests detect BOTH defects?",
+}
+
+BANK_MESSAGES = {
+    8: "BANK ACCOUNT 8: All methods work according to specification. Tests should PASS.",
+}
+
+# For each oracle: test module, variants, the variant that is correct,
+# title for the results, messages describing each variant, the files of
+# the oracle code, and the files that each variant runs.
+ORACLES = {
+    "auction": {
+        "test_module": "auction_test.py",
+        "testcases": range(1, 9),
+        "correct": 1,
+        "title": "Auction Codes",
+        "message": lambda n: AUCTION_MESSAGES.get(n,
+                    f"AUCTION CODE {n}: Some error in auction. At least one test should FAIL."),
+        "oracle_files": ("auction.py",),
+        "variant_files": lambda n: ("auction.py",),
+    },
+    "bank": {
+        "test_module": "test_bank_account.py",
+        "testcases": range(1, 10),
+        "correct": 8,
+        "title": "Bank Account Codes",
+        "message": lambda n: BANK_MESSAGES.get(n,
+                    f"BANK ACCOUNT {n}: Some defect in code. At least one test should FAIL."),
+        # bank_account.py is a copy of one of them, made by runtests.sh
+        "oracle_files": ("bank_correct.py", "bank_bugs.py", "check_index.py",
+                         "bank_account.py"),
+        "variant_files": lambda n: ("bank_correct.py" if n == 8 else "bank_bugs.py",
+                                    "check_index.py"),
+    },
+}
+
+
+def select_variant(oracle, testcase):
+    """Make the oracle code behave as TESTCASE variant testcase.
+       This changes only the current process.
+    """
+    os.environ['TESTCASE'] = str(testcase)
+    if oracle == "auction":
+        import auction
+        auction.Auction.set_testcase(testcase)
+    else:
+        name = "bank_correct" if testcase == ORACLES["bank"]["correct"] else "bank_bugs"
+        sys.modules["bank_account"] = importlib.import_module(name)
+
+
+class RecordingResult(unittest.TextTestResult):
+    """Test result that also records the outcome of each test."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outcomes = {}
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self.outcomes[test.id()] = "ok"
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self.outcomes[test.id()] = "FAIL"
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self.outcomes[test.id()] = "ERROR"
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self.outcomes[test.id()] = "skipped"
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self.outcomes[test.id()] = "expected failure"
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self.outcomes[test.id()] = "unexpected success"
+
+
+def load_tests(test_path):
+    """Import a test module from a file and return its test suite."""
+    name = os.path.splitext(os.path.basename(test_path))[0]
+    spec = importlib.util.spec_from_file_location(name, test_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return unittest.defaultTestLoader.loadTestsFromModule(module)
+
+
+def run_tests(test_path):
+    """Run the tests in a file with verbose output, as unittest -v does.
+       Returns (passed, output, outcome of each test).
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            suite = load_tests(test_path)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            return (False, output.getvalue(), {})
+        runner = unittest.TextTestRunner(stream=output, verbosity=2,
+                                         resultclass=RecordingResult)
+        result = runner.run(suite)
+    passed = result.wasSuccessful()
+    return (passed, output.getvalue(), result.outcomes)
+
+
+def run_variant(oracle, testcase, oracle_dir, test_path):
+    """Run the tests against one variant. Called in a worker process.
+       Returns a dict with the testcase, "OK" or "FAIL", test output,
+       outcome of each test, and timings: "started" is when the worker
+       began the variant (time.time()), "run" is the time to load and
+       run the tests.
+    """
+    started = time.time()
+    set_paths(oracle_dir, test_path)
+    select_variant(oracle, testcase)
+    passed, output, outcomes = run_tests(test_path)
+    return {"testcase": testcase, "actual": "OK" if passed else "FAIL",
+            "output": output, "outcomes": outcomes,
+            "started": started, "run": time.time() - started}
+
+
+def split_startup(results, submitted, workers):
+    """Split the time from submitting the variants until each one started
+       into "queued", waiting for a free worker, and "startup", starting
+       the worker.  Each worker runs one variant and exits, so variants
+       get workers in the order they were submitted: the first ones at
+       once, and each later one when another variant finishes.
+
+       >>> results = [{"started": 10.5, "run": 2.0}, {"started": 10.25, "run": 4.0},
+       ...            {"started": 13.0, "run": 1.0}]
+       >>> split_startup(results, 10.0, workers=2)
+       >>> [(result["queued"], result["startup"]) for result in results]
+       [(0.0, 0.5), (0.0, 0.25), (2.5, 0.5)]
+    """
+    free = sorted([submitted] * workers +
+                  [result["started"] + result["run"] for result in results])
+    for (result, ready) in zip(results, free):
+        started = result.pop("started")
+        ready = min(ready, started)
+        result["queued"] = ready - submitted
+        result["startup"] = started - ready
+
+
+def set_paths(oracle_dir, test_path):
+    """Put the oracle code and the tests on the module search path."""
+    for folder in (os.path.dirname(test_path), oracle_dir):
+        if folder not in sys.path:
+            sys.path.insert(0, folder)
+
+
+def preload(oracle, oracle_dir, test_path):
+    """Import the oracle modules and the tests, so that forks of this
+       process start warm.  The tests are imported again in each fork,
+       after the variant is selected, but everything they import is
+       already loaded.
+    """
+    set_paths(oracle_dir, test_path)
+    if oracle == "auction":
+        importlib.import_module("auction")
+    else:
+        importlib.import_module("bank_bugs")
+        sys.modules["bank_account"] = importlib.import_module("bank_correct")
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            try:
+                load_tests(test_path)
+            except Exception:
+                # reported when the variants run
+                pass
+
+
+def run_all(oracle, oracle_dir, test_path, jobs=None, warm=False, testcases=None):
+    """Run variants of an oracle in parallel, by default all of them.
+       Returns results of run_variant() in testcase order.
+    """
+    if testcases is None:
+        testcases = ORACLES[oracle]["testcases"]
+    if not testcases:
+        return []
+    workers = jobs or os.cpu_count() or 1
+    if warm:
+        preload(oracle, oracle_dir, test_path)
+        # each variant runs in a new fork of this warm process
+        with multiprocessing.get_context("fork").Pool(jobs, maxtasksperchild=1) as pool:
+            submitted = time.time()
+            pending = [pool.apply_async(run_variant, (oracle, testcase, oracle_dir, test_path))
+                       for testcase in testcases]
+            results = [result.get() for result in pending]
+    else:
+        # a new process for each variant, so no state leaks between variants
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                    max_tasks_per_child=1) as pool:
+            submitted = time.time()
+            futures = [pool.submit(run_variant, oracle, testcase, oracle_dir, test_path)
+                       for testcase in testcases]
+            results = [future.result() for future in futures]
+    split_startup(results, submitted, workers)
+    return results
+
+
+def file_hash(path):
+    """SHA-256 of the contents of a file, as hex."""
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def cache_keys(oracle, oracle_dir, test_path, testcases):
+    """The cache key of each variant: a hash of the tests, the other
+       Python files in the test and oracle directories, and the oracle
+       files the variant runs.  Returns {testcase: key}.
+    """
+    config = ORACLES[oracle]
+    shared = {test_path}
+    for folder in {os.path.dirname(test_path), oracle_dir}:
+        for name in os.listdir(folder):
+            if name.endswith(".py") and name not in config["oracle_files"]:
+                shared.add(os.path.join(folder, name))
+    hashes = {path: file_hash(path) for path in shared}
+    shared_hash = hashlib.sha256(json.dumps(
+        sorted((os.path.basename(path), digest) for (path, digest) in hashes.items())
+    ).encode()).hexdigest()
+    keys = {}
+    for testcase in testcases:
+        files = []
+        for name in config["variant_files"](testcase):
+            path = os.path.join(oracle_dir, name)
+            if path not in hashes:
+                hashes[path] = file_hash(path) if os.path.exists(path) else None
+            files.append((name, hashes[path]))
+        identity = [CACHE_VERSION, sys.version_info[:2], oracle, testcase, shared_hash, files]
+        keys[testcase] = hashlib.sha256(json.dumps(identity).encode()).hexdigest()
+    return keys
+
+
+class ResultCache:
+    """Results of run_variant(), one JSON file per key in a directory.
+
+       A result that is read is touched, so the least recently used
+       results are the ones removed when there are more than size of
+       them.  Results older than days are removed too.
+
+       A result is found again only while the files of its variant are
+       unchanged, since they make its key:
+
+       >>> import tempfile
+       >>> folder = tempfile.mkdtemp()
+       >>> def write(name, text):
+       ...     with open(os.path.join(folder, name), "w") as file:
+       ...         file.write(text)
+       >>> for name in ("bank_correct.py", "bank_bugs.py", "check_index.py", "test_bank.py"):
+       ...     write(name, "# " + name)
+       >>> test_path = os.path.join(folder, "test_bank.py")
+       >>> keys = cache_keys("bank", folder, test_path, [7, 8])
+       >>> cache = ResultCache(os.path.join(folder, "cache"), size=2)
+       >>> cache.get(keys[8]) is None
+       True
+       >>> cache.put(keys[8], {"testcase": 8, "actual": "OK"})
+       >>> cache.get(keys[8])
+       {'testcase': 8, 'actual': 'OK'}
+       >>> write("bank_correct.py", "# changed")
+       >>> new_keys = cache_keys("bank", folder, test_path, [7, 8])
+       >>> new_keys[7] == keys[7], new_keys[8] == keys[8]
+       (True, False)
+       >>> cache.get(new_keys[8]) is None
+       True
+       >>> write("test_bank.py", "# more tests")
+       >>> cache_keys("bank", folder, test_path, [7])[7] == keys[7]
+       False
+
+       Only the size most recently used results are kept:
+
+       >>> cache.put(new_keys[8], {"testcase": 8, "actual": "FAIL"})
+       >>> cache.put(keys[7], {"testcase": 7, "actual": "FAIL"})
+       >>> os.utime(cache.path(keys[8]), (0, 0))
+       >>> cache.evict()
+       1
+       >>> cache.get(keys[8]) is None, cache.get(keys[7]) is None
+       (True, False)
+       >>> cache.clear()
+       2
+       >>> import shutil
+       >>> shutil.rmtree(folder)
+    """
+
+    def __init__(self, directory=CACHE_DIR, size=CACHE_SIZE, days=CACHE_DAYS):
+        self.directory = directory
+        self.size = size
+        self.days = days
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """The cached result for a key, or None."""
+        path = self.path(key)
+        try:
+            with open(path) as file:
+                result = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def put(self, key, result):
+        """Save a result, replacing the file at once so that another
+           grader never reads part of it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        temp = self.path(f"{key}.{os.getpid()}.tmp")
+        with open(temp, "w") as file:
+            json.dump(result, file)
+        os.replace(temp, self.path(key))
+
+    def entries(self):
+        """(last used time, path) of each cached result, oldest first."""
+        entries = []
+        with contextlib.suppress(FileNotFoundError):
+            with os.scandir(self.directory) as files:
+                for entry in files:
+                    if entry.name.endswith(".json"):
+                        with contextlib.suppress(FileNotFoundError):
+                            entries.append((entry.stat().st_mtime, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        """Remove results that are too old, then the least recently used
+           results while there are more than size.  Returns the number removed.
+        """
+        entries = self.entries()
+        oldest = time.time() - self.days * 24 * 3600
+        excess = len(entries) - self.size
+        removed = 0
+        for (n, (used, path)) in enumerate(entries):
+            if n < excess or used < oldest:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                removed += 1
+        return removed
+
+    def clear(self):
+        """Remove all cached results.  Returns the number removed."""
+        entries = self.entries()
+        for (used, path) in entries:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        return len(entries)
+
+
+def run_cached(oracle, oracle_dir, test_path, cache, jobs=None, warm=False):
+    """Like run_all(), but take the result of each variant whose files
+       have not changed from the cache, and run only the others.
+       Cached results have "cached": True.
+    """
+    testcases = ORACLES[oracle]["testcases"]
+    keys = cache_keys(oracle, oracle_dir, test_path, testcases)
+    results = {}
+    for testcase in testcases:
+        result = cache.get(keys[testcase])
+        if result is not None:
+            result.update(cached=True, queued=0.0, startup=0.0, run=0.0)
+            results[testcase] = result
+    missing = [testcase for testcase in testcases if testcase not in results]
+    for result in run_all(oracle, oracle_dir, test_path, jobs, warm, missing):
+        cache.put(keys[result["testcase"]], result)
+        results[result["testcase"]] = result
+    cache.evict()
+    return [results[testcase] for testcase in testcases]
+
+
+def expected(oracle, testcase):
+    """The result that good tests should have for a variant."""
+    return "OK" if testcase == ORACLES[oracle]["correct"] else "FAIL"
+
+
+def show_output(oracle, results):
+    """Print the test output of each variant, as runtests.sh does."""
+    for result in results:
+        print("")
+        print(LINE)
+        print(ORACLES[oracle]["message"](result["testcase"]))
+        print(LINE)
+        print(result["output"], end="")
+
+
+def show_results(oracle, results):
+    """Print the table of expected and actual results.
+       Returns the number of variants with an unexpected result.
+    """
+    print(LINE)
+    print(f"Results of Testing All {ORACLES[oracle]['title']}")
+    print(LINE)
+    print("OK=all tests pass, FAIL=some tests fail")
+    print("")
+    print("Auction#  Expect  Actual")
+    failures = 0
+    for result in results:
+        testcase = result["testcase"]
+        expect = expected(oracle, testcase)
+        print("%5d      %-4s     %s" % (testcase, expect, result["actual"]))
+        if expect != result["actual"]:
+            failures += 1
+    print(f"{len(results) - failures} Correct  {failures} Incorrect")
+    return failures
+
+
+def show_timings(results, elapsed):
+    """Print the time each variant waited for a worker, and its startup
+       and run time, in milliseconds.
+    """
+    print(LINE)
+    print("Variant  Queued ms  Startup ms  Run ms")
+    for result in results:
+        if result.get("cached"):
+            print("%5d      cached" % result["testcase"])
+            continue
+        print("%5d   %9.1f   %9.1f  %7.1f" % (result["testcase"], 1000 * result["queued"],
+                                              1000 * result["startup"], 1000 * result["run"]))
+    print(f"Total time {elapsed:.3f} sec")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run unit tests against all variants of an oracle.")
+    parser.add_argument("oracle", nargs="?", choices=sorted(ORACLES))
+    parser.add_argument("-t", "--tests", help="file containing the unit tests")
+    parser.add_argument("-d", "--oracle-dir", default=".",
+                        help="directory containing the oracle code (default: current dir)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--warm", action="store_true",
+                        help="run variants in forks of a preloaded interpreter")
+    parser.add_argument("--timings", action="store_true",
+                        help="show queue wait, startup and run time of each variant")
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help=f"directory of cached results (default: {CACHE_DIR})")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE,
+                        help=f"most results to keep in the cache (default: {CACHE_SIZE})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="run every variant, and do not cache the results")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="remove all cached results, then exit")
+    args = parser.parse_args(argv)
+    cache = ResultCache(args.cache_dir, args.cache_size)
+    if args.clear_cache:
+        print(f"Removed {cache.clear()} cached results from {args.cache_dir}")
+        return 0
+    if args.oracle is None:
+        parser.error("the oracle (auction or bank) is required")
+    test_path = os.path.abspath(args.tests or ORACLES[args.oracle]["test_module"])
+    if not os.path.isfile(test_path):
+        print(f"No tests code {test_path}")
+        return 9
+    start = time.perf_counter()
+    oracle_dir = os.path.abspath(args.oracle_dir)
+    if args.no_cache:
+        results = run_all(args.oracle, oracle_dir, test_path, args.jobs, args.warm)
+    else:
+        results = run_cached(args.oracle, oracle_dir, test_path, cache, args.jobs, args.warm)
+    elapsed = time.perf_counter() - start
+    show_output(args.oracle, results)
+    failures = show_results(args.oracle, results)
+    cached = sum(1 for result in results if result.get("cached"))
+    if cached:
+        print(f"{cached} of {len(results)} variants are cached results "
+              f"(use --no-cache to run them again)")
+    if args.timings:
+        show_timings(results, elapsed)
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(main())